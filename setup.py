@@ -49,15 +49,16 @@ setuptools.setup(
     install_requires=[
         "ecmwflibs>=0.5.3",
         "netCDF4", 
-        "dask[array]",
         "Magics",
         "Flask",
-        "xarray",
         "geojson",
         "future-annotations", # A backport of __future__ annotations to python<3.7
         "python-dateutil",
         "flask-cors",
     ],
+    extras_require={
+        "compositing": ["Pillow"],
+    },
     entry_points={
         "console_scripts": ["skinny-wms=skinnywms.skinny:main"],
     },
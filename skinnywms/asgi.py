@@ -0,0 +1,333 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from skinnywms import errors
+
+__all__ = [
+    "WMSApplication",
+]
+
+LOG = logging.getLogger(__name__)
+
+# the requests that may render a map, the others are answered from the event
+# loop
+RENDER_REQUESTS = ("getmap", "getlegendgraphic")
+
+
+class Headers(dict):
+    """Request headers, looked up without regard to case."""
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+    def __getitem__(self, name):
+        return super().__getitem__(name.lower())
+
+    def __contains__(self, name):
+        return super().__contains__(name.lower())
+
+
+class Request:
+    """The parts of an ASGI HTTP request used by `WMSServer.process`."""
+
+    def __init__(self, scope: dict):
+        self.headers = Headers(
+            (name.decode("latin-1").lower(), value.decode("latin-1"))
+            for name, value in scope.get("headers", [])
+        )
+        self.path = scope.get("root_path", "") + scope["path"]
+        self.query_string = scope.get("query_string", b"").decode("latin-1")
+        self.args = dict(parse_qsl(self.query_string, keep_blank_values=True))
+
+        host = self.headers.get("host")
+        if host is None:
+            server = scope.get("server") or ("localhost", None)
+            host = server[0] if server[1] is None else "%s:%s" % server
+        self.url = "%s://%s%s" % (scope.get("scheme", "http"), host, self.path)
+        if self.query_string:
+            self.url += "?" + self.query_string
+
+
+class Response:
+    """A response, created with the same arguments as a Flask response."""
+
+    def __init__(self, response=None, status=200, headers=None, mimetype=None):
+        self.response = response
+        self.status = status
+        self.headers = dict(headers or {})
+        self.mimetype = mimetype
+
+    def body(self) -> bytes:
+        if self.response is None:
+            return b""
+        if isinstance(self.response, str):
+            return self.response.encode("utf-8")
+        return bytes(self.response)
+
+    async def send(self, send, headers=None) -> None:
+        body = self.body()
+        all_headers = dict(self.headers)
+        all_headers.update(headers or {})
+        if self.mimetype is not None:
+            content_type = self.mimetype
+            if content_type.startswith("text/"):
+                content_type += "; charset=utf-8"
+            all_headers["Content-Type"] = content_type
+        all_headers["Content-Length"] = str(len(body))
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status,
+                "headers": [
+                    (name.lower().encode("latin-1"), str(value).encode("latin-1"))
+                    for name, value in all_headers.items()
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def json_response(value) -> Response:
+    return Response(json.dumps(value), mimetype="application/json")
+
+
+class WMSApplication:
+    """An ASGI application serving a `WMSServer`.
+
+    Capabilities, availability and metrics are served from the event loop, so
+    that they are not held up by slow renders. Maps and legends are rendered
+    in a pool of `concurrency` threads. Up to `queue_size` requests may wait
+    for a free thread, for at most `queue_timeout` seconds: beyond that, the
+    server is overloaded and requests are answered with a 503 status and a
+    WMS exception.
+
+    :param server: the WMS server
+    :param render_template: renders the templates of the server
+    :param static_folder: directory of the files served under /static
+    :param concurrency: number of requests rendered at the same time
+    :param queue_size: number of requests waiting to be rendered
+    :param queue_timeout: number of seconds a request may wait to be rendered
+    :param cors_origins: "*" or a list of origins allowed to access the server
+    """
+
+    def __init__(
+        self,
+        server,
+        render_template,
+        static_folder: str = None,
+        concurrency: int = 4,
+        queue_size: int = None,
+        queue_timeout: float = 30.0,
+        cors_origins=None,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.server = server
+        self.render_template = render_template
+        self.static_folder = static_folder
+        self.concurrency = concurrency
+        self.queue_size = queue_size if queue_size is not None else 4 * concurrency
+        self.queue_timeout = queue_timeout
+        self.cors_origins = cors_origins
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="skinnywms-render"
+        )
+        # created in the event loop, see `_acquire()`
+        self._semaphore = None
+        self._loaded = False
+        self._waiting = 0
+        self._rendering = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        if scope["type"] != "http":
+            return
+
+        request = Request(scope)
+        if scope.get("method", "GET") not in ("GET", "HEAD"):
+            response = Response("Method not allowed", status=405, mimetype="text/plain")
+        else:
+            response = await self.dispatch(request)
+
+        if scope.get("method") == "HEAD":
+            response.response = None
+
+        await response.send(send, self.cors_headers(request))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # load the data without delaying the startup, nor blocking
+                # the event loop
+                asyncio.get_running_loop().run_in_executor(None, self.load)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def load(self) -> None:
+        self.server.availability.layers()
+        self._loaded = True
+
+    async def cheap(self, function, *args):
+        # until the data is loaded, even cheap requests may take a while
+        if self._loaded:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._load_and_call, function, *args
+        )
+
+    def _load_and_call(self, function, *args):
+        self.load()
+        return function(*args)
+
+    async def dispatch(self, request: Request) -> Response:
+        path = request.path
+        if path == "/wms":
+            return await self.wms(request)
+        if path == "/availability":
+            return await self.cheap(self.availability)
+        if path == "/metrics":
+            return json_response(self.stats())
+        if path == "/":
+            return Response(
+                self.render_template("leaflet_demo.html"), mimetype="text/html"
+            )
+        if path.startswith("/static/") and self.static_folder is not None:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.static, path[len("/static/") :]
+            )
+        return Response("Not found", status=404, mimetype="text/plain")
+
+    async def wms(self, request: Request) -> Response:
+        req, version = "getcapabilities", "1.3.0"
+        for name, value in request.args.items():
+            if name.lower() == "request":
+                req = value.lower()
+            elif name.lower() == "version":
+                version = value
+
+        if req == "getcapabilities" and not self.server.capabilities_rendered(version):
+            # rendered over all the layers and times, which would hold up
+            # all the other requests if done in the event loop
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._load_and_call, self.process, request
+            )
+
+        if req not in RENDER_REQUESTS:
+            return await self.cheap(self.process, request)
+
+        if not await self._acquire():
+            return self.unavailable(request)
+
+        self._rendering += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.process, request
+            )
+        finally:
+            self._rendering -= 1
+            self._semaphore.release()
+
+    def availability(self) -> Response:
+        return json_response(self.server.availability.as_dict())
+
+    def process(self, request: Request) -> Response:
+        return self.server.process(
+            request,
+            Response=Response,
+            send_file=None,
+            render_template=self.render_template,
+        )
+
+    async def _acquire(self) -> bool:
+        """Waits for a free render slot, returns False if the server is
+        overloaded."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        if self._semaphore.locked() and self._waiting >= self.queue_size:
+            self.rejected += 1
+            return False
+
+        self._waiting += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            LOG.warning(
+                "Request not rendered after waiting %.1fs",
+                time.monotonic() - start,
+            )
+            return False
+        finally:
+            self._waiting -= 1
+        return True
+
+    def unavailable(self, request: Request) -> Response:
+        version = errors.version_param(request.args) or "1.3.0"
+        exc = errors.ServiceUnavailable("Server overloaded, try again later")
+        return Response(
+            exc.body(version),
+            status=exc.status,
+            headers={"Retry-After": "1"},
+            mimetype=exc.content_type(version),
+        )
+
+    def static(self, name: str) -> Response:
+        root = os.path.realpath(self.static_folder)
+        path = os.path.realpath(os.path.join(root, name))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return Response("Not found", status=404, mimetype="text/plain")
+
+        with open(path, "rb") as f:
+            content = f.read()
+        mimetype, _ = mimetypes.guess_type(path)
+        return Response(content, mimetype=mimetype or "application/octet-stream")
+
+    def cors_headers(self, request: Request) -> dict:
+        if not self.cors_origins:
+            return {}
+        if self.cors_origins == "*":
+            return {"Access-Control-Allow-Origin": "*"}
+        origin = request.headers.get("Origin")
+        if origin in self.cors_origins:
+            return {"Access-Control-Allow-Origin": origin, "Vary": "Origin"}
+        return {}
+
+    def stats(self) -> dict:
+        result = self.server.stats()
+        result["asgi"] = dict(
+            concurrency=self.concurrency,
+            queue_size=self.queue_size,
+            rendering=self._rendering,
+            waiting=self._waiting,
+            rejected=self.rejected,
+            timed_out=self.timed_out,
+        )
+        return result
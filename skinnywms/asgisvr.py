@@ -0,0 +1,47 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+"""The WMS server as an ASGI application, e.g.:
+
+    uvicorn skinnywms.asgisvr:application
+
+The server is configured as by `skinnywms.wmssvr`.
+"""
+
+import os
+
+from flask import render_template as flask_render_template
+
+from .asgi import WMSApplication
+from .wmssvr import application as flask_application
+from .wmssvr import origins, render_pool, server
+
+concurrency = int(os.environ.get("SKINNYWMS_ASGI_CONCURRENCY", "0") or 0)
+if concurrency <= 0:
+    # renders in the server process are serialised, but requests found in the
+    # cache can be answered meanwhile
+    concurrency = max(render_pool.workers if render_pool else 0, 4)
+
+queue_size = os.environ.get("SKINNYWMS_ASGI_QUEUE_SIZE", "")
+queue_timeout = float(os.environ.get("SKINNYWMS_ASGI_QUEUE_TIMEOUT", "30") or 30)
+
+
+def render_template(template, **variables):
+    with flask_application.app_context():
+        return flask_render_template(template, **variables)
+
+
+application = WMSApplication(
+    server,
+    render_template,
+    static_folder=flask_application.static_folder,
+    concurrency=concurrency,
+    queue_size=int(queue_size) if queue_size != "" else None,
+    queue_timeout=queue_timeout,
+    cors_origins=origins,
+)
@@ -0,0 +1,233 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+import logging
+import os
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+
+from skinnywms.server import MemoryFile, NoCaching, layer_identity
+
+__all__ = [
+    "Caching",
+    "DiskCache",
+    "MemoryCache",
+    "layer_identity",
+]
+
+LOG = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """A thread-safe LRU cache of rendered images, bounded in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> bytes:
+        with self._lock:
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def put(self, key: str, content: bytes) -> None:
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = content
+            self._size += len(content)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return dict(
+            entries=len(self._entries),
+            bytes=self._size,
+            max_bytes=self.max_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+class DiskCache:
+    """A cache of rendered images stored in a directory, bounded in bytes.
+
+    The directory may be shared by several server processes. Entries are
+    evicted in least recently used order (based on the modification time of
+    the files, which is updated on every hit) when the size of the directory
+    grows over `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self._size = sum(size for _, _, size in self._scan())
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def _scan(self):
+        for subdir in os.scandir(self.path):
+            # only the subdirectories of the keys (see _file), not e.g. the
+            # directories of other caches nested in this one
+            if len(subdir.name) != 2 or not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                yield entry.path, st.st_mtime_ns, st.st_size
+
+    def get(self, key: str) -> bytes:
+        fname = self._file(key)
+        try:
+            with open(fname, "rb") as f:
+                content = f.read()
+            os.utime(fname)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return content
+
+    def put(self, key: str, content: bytes) -> None:
+        if len(content) > self.max_bytes:
+            return
+        fname = self._file(key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp, 0o644)
+        try:
+            # the entry is overwritten, e.g. by another process
+            previous = os.stat(fname).st_size
+        except OSError:
+            previous = 0
+        os.replace(tmp, fname)
+
+        with self._lock:
+            self._size += len(content) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # The directory may be shared with other processes, so recompute
+        # its actual size before evicting, and leave some headroom
+        entries = sorted(self._scan(), key=lambda e: e[1])
+        self._size = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for fname, _, size in entries:
+            if self._size <= target:
+                break
+            try:
+                os.unlink(fname)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return dict(
+            path=self.path,
+            bytes=self._size,
+            max_bytes=self.max_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+class Caching(NoCaching):
+    """Caches rendered images in memory and, optionally, on disk.
+
+    :param memory_size: size in bytes of the in-memory LRU cache (0 to disable)
+    :param directory: directory of the on-disk cache (None to disable)
+    :param disk_size: size in bytes of the on-disk cache
+    """
+
+    enabled = True
+
+    def __init__(
+        self,
+        memory_size: int = 256 * 1024 * 1024,
+        directory: str = None,
+        disk_size: int = 4 * 1024 * 1024 * 1024,
+    ):
+        self.memory = MemoryCache(memory_size) if memory_size else None
+        self.disk = DiskCache(directory, disk_size) if directory else None
+
+    def create_output(self):
+        return MemoryFile()
+
+    def get(self, key: str) -> bytes:
+        if self.memory is not None:
+            content = self.memory.get(key)
+            if content is not None:
+                return content
+
+        if self.disk is not None:
+            content = self.disk.get(key)
+            if content is not None:
+                if self.memory is not None:
+                    self.memory.put(key, content)
+                return content
+
+        return None
+
+    def put(self, key: str, content: bytes) -> None:
+        if self.memory is not None:
+            self.memory.put(key, content)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, content)
+            except OSError as e:
+                LOG.warning("Cannot write to disk cache %s: %s", self.disk.path, e)
+
+    def stats(self) -> dict:
+        return dict(
+            memory=self.memory.stats() if self.memory is not None else None,
+            disk=self.disk.stats() if self.disk is not None else None,
+        )
@@ -0,0 +1,130 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+import io
+import logging
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ModuleNotFoundError:
+    Image = None
+
+__all__ = [
+    "available",
+    "composite",
+    "decode",
+    "encode",
+    "split",
+]
+
+LOG = logging.getLogger(__name__)
+
+FORMATS = {
+    "image/png": "PNG",
+}
+
+
+def available(format: str) -> bool:
+    """Returns True if images of `format` can be composited, which requires
+    the optional Pillow package."""
+    return Image is not None and format in FORMATS
+
+
+def decode(content: bytes) -> np.ndarray:
+    """Decodes an image into an array of RGBA values between 0 and 1."""
+    with Image.open(io.BytesIO(content)) as image:
+        return np.asarray(image.convert("RGBA"), dtype=np.float32) / 255.0
+
+
+def encode(rgba: np.ndarray, format: str = "image/png", alpha: bool = True) -> bytes:
+    """Encodes an array of RGBA values between 0 and 1."""
+    pixels = np.rint(np.clip(rgba, 0.0, 1.0) * 255.0).astype(np.uint8)
+    if alpha:
+        image = Image.fromarray(pixels, "RGBA")
+    else:
+        image = Image.fromarray(np.ascontiguousarray(pixels[..., :3]), "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, FORMATS[format])
+    return buffer.getvalue()
+
+
+def parse_bgcolor(bgcolor: str) -> tuple:
+    """Parses a WMS BGCOLOR (0xRRGGBB), white by default."""
+    if not bgcolor:
+        return (1.0, 1.0, 1.0)
+    value = int(bgcolor[2:] if bgcolor.lower().startswith("0x") else bgcolor, 16)
+    return tuple(((value >> shift) & 0xFF) / 255.0 for shift in (16, 8, 0))
+
+
+def composite(
+    images: list, format: str = "image/png", transparent: bool = True, bgcolor=None
+) -> bytes:
+    """Composites images of the same size, the first one at the bottom, with
+    the 'over' operator. Unless `transparent`, the result is composited over
+    `bgcolor`.
+    """
+    rgb = None
+    alpha = None
+    for content in images:
+        layer = decode(content)
+        layer_alpha = layer[..., 3:]
+        # premultiplied colours
+        layer_rgb = layer[..., :3] * layer_alpha
+        if rgb is None:
+            rgb, alpha = layer_rgb, layer_alpha
+        else:
+            if layer.shape != (rgb.shape[0], rgb.shape[1], 4):
+                raise ValueError(
+                    "Cannot composite images of different sizes: %s and %s"
+                    % (layer.shape[:2], rgb.shape[:2])
+                )
+            rgb = layer_rgb + rgb * (1.0 - layer_alpha)
+            alpha = layer_alpha + alpha * (1.0 - layer_alpha)
+
+    if not transparent:
+        rgb = rgb + np.asarray(parse_bgcolor(bgcolor), dtype=np.float32) * (1.0 - alpha)
+        alpha = np.ones_like(alpha)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rgb = np.where(alpha > 0, rgb / alpha, 0.0)
+
+    return encode(np.concatenate([rgb, alpha], axis=-1), format, alpha=transparent)
+
+
+def split(
+    content: bytes,
+    columns: int,
+    rows: int,
+    format: str = "image/png",
+    alpha=True,
+    margins: tuple = (0, 0, 0, 0),
+) -> list:
+    """Splits an image into rows of `columns` x `rows` tiles of equal size,
+    once its `margins` (left, top, right, bottom, in pixels) are cropped."""
+    rgba = decode(content)
+    left, top, right, bottom = margins
+    rgba = rgba[top : rgba.shape[0] - bottom, left : rgba.shape[1] - right]
+    height, width = rgba.shape[0] // rows, rgba.shape[1] // columns
+    if height * rows != rgba.shape[0] or width * columns != rgba.shape[1]:
+        raise ValueError(
+            "Cannot split an image of %sx%s pixels into %sx%s tiles"
+            % (rgba.shape[1], rgba.shape[0], columns, rows)
+        )
+    return [
+        [
+            encode(
+                rgba[j * height : (j + 1) * height, i * width : (i + 1) * width],
+                format,
+                alpha=alpha,
+            )
+            for i in range(columns)
+        ]
+        for j in range(rows)
+    ]
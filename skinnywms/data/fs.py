@@ -1,12 +1,17 @@
 # Copyright (C) ECMWF 2018
 
+import importlib.metadata
 import logging
+import multiprocessing
 import os
 import threading
 import traceback
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, List, Union
 
-from skinnywms import datatypes
+from skinnywms import __version__, datatypes
+from skinnywms.data.index import FieldIndex
 from skinnywms.fields.GeoJSONField import GeoJSONReader
 from skinnywms.fields.GRIBField import GRIBReader
 from skinnywms.fields.NetCDFField import NetCDFReader
@@ -23,11 +28,34 @@ class Availability(datatypes.Availability):
 
     log = logging.getLogger(__name__)
 
-    def __init__(self, path, *args, **kwargs):
+    def __init__(self, path, *args, index_path=None, scan_workers=0, **kwargs):
         super(Availability, self).__init__(*args, **kwargs)
+        self._scan_workers = scan_workers
         self._path = path
         self._paths = {}
+        self._files = {}
         self._loaded = False
+        self._index_path = index_path
+        self._index = None
+
+    def index_signature(self) -> dict:
+        """Returns what, if changed, invalidates the fields stored in the index,
+        including what the styles of the fields are computed with: the version
+        of Magics and the files of the style paths."""
+        styler = self.context.styler
+        return dict(
+            version=__version__,
+            path=os.path.abspath(self._path),
+            user_style=repr(getattr(styler, "user_style", None)),
+            style_path=os.environ.get("MAGICS_STYLE_PATH"),
+            magics_prefix=getattr(self.context, "magics_prefix", None),
+            magics=_magics_version(styler),
+            packages={name: _package_version(name) for name in ("Magics", "ecmwflibs")},
+            style_files=_files_signature(
+                os.environ.get("MAGICS_STYLE_PATH", "").split(":")
+                + os.environ.get("MAGICS_USER_STYLE_PATH", "").split(":")
+            ),
+        )
 
     def load(self):
 
@@ -36,41 +64,195 @@ class Availability(datatypes.Availability):
             if self._loaded:
                 return
 
-            if os.path.isdir(self._path):
-                self.add_directory(self._path)
-            elif os.path.isfile(self._path):
-                self.add_file(self._path)
-            else:
-                raise NotImplementedError(
-                    "%s is neither a file not  a directory" % (self._path,)
-                )
+            if self._index_path:
+                self._index = FieldIndex(self._index_path, self.index_signature())
+
+            with self._index.locked() if self._index else nullcontext():
+
+                if self._index is not None:
+                    self._index.load()
+
+                if os.path.isdir(self._path):
+                    self.add_directory(self._path)
+                elif os.path.isfile(self._path):
+                    self.add_file(self._path)
+                else:
+                    raise NotImplementedError(
+                        "%s is neither a file not  a directory" % (self._path,)
+                    )
+
+                if self._index is not None:
+                    self._index.save()
+
             self._loaded = True
 
     def add_directory(self, path: str):
-        for fname in sorted(os.listdir(path)):
-            fname = os.path.join(path, fname)
-            if os.path.isdir(fname):
-                self.add_directory(fname)
-            if not os.path.isfile(fname):
-                continue
-
-            self.add_file(fname)
-
-    def add_file(self, path: str):
-        self.log.info("Scanning %s", path)
-        try:
-            reader = _reader(self.context, path)
-        except ValueError as exc:
-            self.log.info("Skipping file %s: %s", path, exc)
-            self._paths[path] = [traceback.format_exc()]
+        paths = list(list_files(path))
+        scanned = self.scan_files(self.unindexed(paths))
+        for fname in paths:
+            self.add_file(fname, scanned.get(fname))
+
+    def add_file(self, path: str, scanned=None):
+        stat = _stat(path)
+        fields = self.get_fields(path, scanned)
+
+        if not isinstance(fields, list):
+            # the file could not be read
+            self._files[path] = (stat, [])
+            self._paths[path] = [fields]
             return
 
-        n = 0
-        for field in reader.get_fields():
-            n += 1
+        for field in fields:
             self.add_field(field)
 
-        self._paths[path] = n
+        self._files[path] = (stat, fields)
+        self._paths[path] = len(fields)
+
+    def get_fields(self, path: str, scanned=None) -> Union[List[datatypes.Field], str]:
+        """Returns the fields of a file from the index if it is up to date,
+        otherwise the fields already `scanned` or scans the file (see scan_file)."""
+        fields = None
+        if self._index is not None:
+            fields = self._index.lookup(path)
+            if fields is not None:
+                self.log.info("Found %s in %s", path, self._index)
+                for field in fields if isinstance(fields, list) else []:
+                    field.set_context(self.context)
+
+        if fields is None:
+            fields = scanned if scanned is not None else self.scan_file(path)
+            if self._index is not None:
+                self._index.update(path, fields)
+
+        return fields
+
+    def refresh(self) -> bool:
+        """Rescans the data path and applies the changes while the layers are
+        in use: fields of new files are added, fields of modified files are
+        replaced and fields of deleted files are removed.
+
+        :return: True if any file has been added, modified or deleted
+        :rtype: bool
+        """
+        if not self._loaded:
+            self.load()
+            return True
+
+        with LOCK:
+            if os.path.isdir(self._path):
+                paths = list(list_files(self._path))
+            elif os.path.isfile(self._path):
+                paths = [self._path]
+            else:
+                paths = []
+
+            known = set(paths)
+            deleted = [path for path in self._files if path not in known]
+            modified = []
+            for path in paths:
+                try:
+                    stat = _stat(path)
+                except OSError:  # deleted in the meantime
+                    continue
+                if path not in self._files or self._files[path][0] != stat:
+                    modified.append(path)
+
+            if not deleted and not modified:
+                return False
+
+            add, remove = [], []
+
+            for path in deleted:
+                self.log.info("Removing %s", path)
+                remove += self._files.pop(path)[1]
+                self._paths.pop(path, None)
+
+            with self._index.locked() if self._index else nullcontext():
+
+                if self._index is not None:
+                    # pick up the files indexed by other processes
+                    self._index.load()
+
+                try:
+                    scanned = self.scan_files(self.unindexed(modified))
+                except Exception as e:
+                    self.log.exception("Cannot scan files in parallel: %s", e)
+                    scanned = {}
+
+                for path in modified:
+                    self.log.info("Updating %s", path)
+                    try:
+                        stat = _stat(path)
+                        fields = self.get_fields(path, scanned.get(path))
+                    except Exception as e:
+                        # e.g. the file is still being written
+                        self.log.exception("Cannot scan %s: %s", path, e)
+                        fields = traceback.format_exc()
+                        stat = None
+
+                    if path in self._files:
+                        remove += self._files[path][1]
+
+                    if isinstance(fields, list):
+                        add += fields
+                        self._files[path] = (stat, fields)
+                        self._paths[path] = len(fields)
+                    else:
+                        self._files[path] = (stat, [])
+                        self._paths[path] = [fields]
+
+                if self._index is not None:
+                    for path in deleted:
+                        self._index.remove(path)
+                    self._index.save(prune=False)
+
+            self.update_fields(add, remove)
+            return True
+
+    def unindexed(self, paths: List[str]) -> List[str]:
+        """Returns the paths that are not up to date in the index."""
+        if self._index is None:
+            return paths
+        return [path for path in paths if self._index.lookup(path) is None]
+
+    def scan_file(self, path: str) -> Union[List[datatypes.Field], str]:
+        """Returns the fields found in a file, or the reason why the file
+        is not supported."""
+        return scan_file(self.context, path)
+
+    def scan_files(self, paths: List[str]) -> Dict[str, Union[List[datatypes.Field], str]]:
+        """Scans files in parallel in a pool of `scan_workers` processes.
+        Returns an empty dictionary if parallel scanning is disabled, in which
+        case files are scanned one after the other when they are added. Files
+        that cannot be scanned by a process are left out, and scanned again
+        when they are added.
+        """
+        if self._scan_workers < 2 or len(paths) < 2:
+            return {}
+
+        self.log.info(
+            "Scanning %s files with %s processes", len(paths), self._scan_workers
+        )
+
+        context = self.context
+        with ProcessPoolExecutor(
+            max_workers=min(self._scan_workers, len(paths)),
+            mp_context=multiprocessing.get_context(),
+            initializer=_init_scan_process,
+            initargs=(context.styler, getattr(context, "magics_prefix", None)),
+        ) as executor:
+            # results are returned in the order of the paths
+            scanned = {
+                path: fields
+                for path, fields in zip(paths, executor.map(_scan_file, paths))
+                if fields is not None
+            }
+
+        for fields in scanned.values():
+            for field in fields if isinstance(fields, list) else []:
+                field.set_context(context)
+
+        return scanned
 
     def as_dict(self):
         d = super(Availability, self).as_dict()
@@ -78,6 +260,91 @@ class Availability(datatypes.Availability):
         return d
 
 
+def scan_file(context: WMSServer, path: str) -> Union[List[datatypes.Field], str]:
+    log = Availability.log
+    log.info("Scanning %s", path)
+    try:
+        reader = _reader(context, path)
+    except ValueError as exc:
+        log.info("Skipping file %s: %s", path, exc)
+        return traceback.format_exc()
+
+    return list(reader.get_fields())
+
+
+class ScanContext:
+    """The server context of the fields scanned in another process."""
+
+    def __init__(self, styler, magics_prefix=None):
+        self.styler = styler
+        if magics_prefix is not None:
+            self.magics_prefix = magics_prefix
+        self.stash = {}
+
+
+_SCAN_CONTEXT = None
+
+
+def _init_scan_process(styler, magics_prefix):
+    global _SCAN_CONTEXT
+    _SCAN_CONTEXT = ScanContext(styler, magics_prefix)
+
+
+def _scan_file(path: str):
+    try:
+        return scan_file(_SCAN_CONTEXT, path)
+    except Exception as e:
+        # e.g. the file is still being written, see Availability.scan_files
+        Availability.log.exception("Cannot scan %s: %s", path, e)
+        return None
+
+
+def list_files(path: str):
+    """Yields the paths of all the files in a directory and its sub-directories,
+    in a deterministic order."""
+    for fname in sorted(os.listdir(path)):
+        fname = os.path.join(path, fname)
+        if os.path.isdir(fname):
+            yield from list_files(fname)
+        if not os.path.isfile(fname):
+            continue
+
+        yield fname
+
+
+def _stat(path: str):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _magics_version(styler):
+    driver = getattr(styler, "driver", None)
+    try:
+        return driver.version() if driver is not None else None
+    except Exception:
+        return None
+
+
+def _package_version(name: str):
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def _files_signature(paths: List[str]) -> list:
+    """Returns the path, size and modification time of the files of `paths`
+    (files or directories), ignoring the paths that do not exist (e.g. the
+    names of the styles bundled with Magics)."""
+    result = []
+    for path in paths:
+        if os.path.isfile(path):
+            result.append((path,) + _stat(path))
+        elif os.path.isdir(path):
+            result += [(f,) + _stat(f) for f in list_files(path)]
+    return result
+
+
 READERS: Dict[bytes, datatypes.FieldReader] = {
     b"GRIB": GRIBReader,
     b"\x89HDF": NetCDFReader,
@@ -0,0 +1,166 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+import logging
+import os
+import pickle
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+__all__ = [
+    "FieldIndex",
+]
+
+LOG = logging.getLogger(__name__)
+
+
+class FieldIndex:
+    """A persistent index of the fields found in data files, so that only new or
+    modified files need to be scanned when the server starts.
+
+    Entries are keyed by file path and are valid as long as the size and the
+    modification time of the file do not change. The whole index is discarded
+    if its `signature` (e.g. the software version or the style configuration)
+    differs from the one it was written with.
+
+    The index is a pickle file: it must only be written by a trusted server.
+
+    :param path: path of the index file
+    :param signature: anything that, if changed, invalidates the index
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str, signature=None):
+        self.path = path
+        self.signature = signature
+        self._entries = {}
+        self._seen = set()
+        self._stats = {}
+        self._modified = False
+
+    @contextmanager
+    def locked(self):
+        """Serialises the update of the index between processes sharing it,
+        so that a file is only scanned by the first of them.
+        """
+        if fcntl is None:
+            yield self
+            return
+
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self) -> None:
+        self._entries = {}
+        self._seen = set()
+        self._modified = False
+
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "rb") as f:
+                content = pickle.load(f)
+        except Exception as e:
+            LOG.warning("Ignoring unreadable index %s: %s", self.path, e)
+            return
+
+        if content.get("version") != self.VERSION:
+            LOG.info("Ignoring index %s: version has changed", self.path)
+            return
+
+        if content.get("signature") != self.signature:
+            LOG.info("Ignoring index %s: signature has changed", self.path)
+            return
+
+        self._entries = content["entries"]
+        LOG.info("Loaded index %s (%s files)", self.path, len(self._entries))
+
+    def save(self, prune: bool = True) -> None:
+        """Writes the index if it has been modified.
+
+        :param prune: forget about the files that have not been looked up
+        """
+        if prune:
+            for path in set(self._entries) - self._seen:
+                del self._entries[path]
+                self._modified = True
+
+        if not self._modified:
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".skinnywms-index-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(
+                    dict(
+                        version=self.VERSION,
+                        signature=self.signature,
+                        entries=self._entries,
+                    ),
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+        self._modified = False
+        LOG.info("Saved index %s (%s files)", self.path, len(self._entries))
+
+    def _stat(self, path: str):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def lookup(self, path: str):
+        """Returns what was indexed for `path`, i.e. the list of its fields or
+        the error that prevented scanning it, or None if `path` is not in the
+        index or has been modified since it was indexed.
+        """
+        self._seen.add(path)
+        # remember the state of the file before it is (re)scanned
+        stat = self._stats[path] = self._stat(path)
+
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+
+        size, mtime, fields = entry
+        if stat != (size, mtime):
+            return None
+
+        return fields
+
+    def update(self, path: str, fields) -> None:
+        self._seen.add(path)
+        size, mtime = self._stats.pop(path, None) or self._stat(path)
+        self._entries[path] = (size, mtime, fields)
+        self._modified = True
+
+    def remove(self, path: str) -> None:
+        if self._entries.pop(path, None) is not None:
+            self._modified = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "FieldIndex[%s]" % (self.path,)
@@ -226,6 +226,7 @@ class MvAvailability(datatypes.Availability):
             layer_name = layer_type + "_" + str(layer_id)
 
         zindex = layer_id
+        self._generation += 1
 
         if layer_type == "map":
             self._layers[layer_name] = MvMapLayer(
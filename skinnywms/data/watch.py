@@ -0,0 +1,138 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+import logging
+import os
+import threading
+import time
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ModuleNotFoundError:
+    FileSystemEventHandler = object
+    Observer = None
+
+__all__ = [
+    "Watcher",
+]
+
+LOG = logging.getLogger(__name__)
+
+# the events that change the data, e.g. not the "opened" and "closed_no_write"
+# events of the files read while rendering
+CHANGES = ("created", "modified", "moved", "deleted", "closed")
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in CHANGES:
+            self.watcher.notify()
+
+
+class Watcher:
+    """Keeps an availability up to date with its data path, by calling its
+    `refresh` method when files are added, modified or deleted.
+
+    Changes are detected with inotify (or the native mechanism of the platform)
+    if the optional `watchdog` package is installed. Otherwise, or in addition,
+    the data path is polled every `interval` seconds.
+
+    :param availability: the availability to refresh
+    :param path: the path to watch
+    :param interval: number of seconds between two polls
+    :param delay: number of seconds without any change before refreshing, so
+        that files that are being written are only scanned once complete
+    :param max_delay: maximum number of seconds a refresh is postponed while
+        changes keep coming
+    """
+
+    def __init__(
+        self,
+        availability,
+        path: str,
+        interval: float = 60.0,
+        delay: float = 2.0,
+        max_delay: float = 30.0,
+    ):
+        self.availability = availability
+        self.path = path
+        self.interval = interval
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self._event = threading.Event()
+        self._first_event = None
+        self._last_event = 0.0
+        self._stopped = False
+        self._thread = None
+        self._observer = None
+
+    def notify(self) -> None:
+        self._last_event = time.monotonic()
+        if self._first_event is None:
+            self._first_event = self._last_event
+        self._event.set()
+
+    def start(self) -> None:
+        if Observer is not None:
+            try:
+                path = self.path
+                if os.path.isfile(path):
+                    path = os.path.dirname(os.path.abspath(path))
+                self._observer = Observer()
+                self._observer.schedule(_EventHandler(self), path, recursive=True)
+                self._observer.daemon = True
+                self._observer.start()
+                LOG.info("Watching %s for changes", self.path)
+            except Exception as e:
+                LOG.warning("Cannot watch %s, polling only: %s", self.path, e)
+                self._observer = None
+        else:
+            LOG.info("Polling %s every %ss", self.path, self.interval)
+
+        self._thread = threading.Thread(
+            target=self._run, name="skinnywms-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._event.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    def _run(self):
+        while not self._stopped:
+            self._event.wait(self.interval)
+
+            # wait until there are no more changes for a while, but not forever
+            # if files keep changing
+            first = self._first_event
+            while not self._stopped and first is not None:
+                now = time.monotonic()
+                remaining = (
+                    min(self._last_event + self.delay, first + self.max_delay) - now
+                )
+                if remaining <= 0:
+                    break
+                time.sleep(remaining)
+
+            self._event.clear()
+            self._first_event = None
+            if self._stopped:
+                break
+
+            try:
+                if self.availability.refresh():
+                    LOG.info("Refreshed %s", self.path)
+            except Exception as e:
+                LOG.exception("Cannot refresh %s: %s", self.path, e)
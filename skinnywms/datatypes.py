@@ -1,3 +1,6 @@
+from __future__ import annotations
+
+import bisect
 import datetime
 import logging
 import weakref
@@ -21,6 +24,7 @@ from skinnywms.server import WMSServer
 __all__ = [
     "Availability",
     "CRS",
+    "FieldCube",
     "Layer",
     "Plotter",
     "Style",
@@ -75,6 +79,13 @@ class Style:
 
 
 class Field:
+    # no per-instance dictionary in subclasses that define __slots__
+    __slots__ = ()
+
+    def set_context(self, context: WMSServer) -> None:
+        """Called when a field restored from an index is attached to a server."""
+        pass
+
     def style(self, name: str) -> str:
 
         if name == "":
@@ -145,6 +156,71 @@ class Field:
         self._companion = value
 
 
+class FieldCube(Field):
+    """A hypercube of fields, e.g. all the times and levels of a NetCDF
+    variable, that only creates the field of a (time, level) when it is
+    selected, so that memory does not grow with the number of combinations.
+
+    The names and titles are the ones of the first field of the cube.
+    """
+
+    # the field at the first time and level
+    first = None
+
+    @property
+    def times(self) -> list:
+        """The times of the fields, or [None]."""
+        raise NotImplementedError()
+
+    @property
+    def levels(self) -> list:
+        """The levels of the fields, or [None]."""
+        raise NotImplementedError()
+
+    def field(self, time, levelist) -> Field:
+        """Returns the field at `time` and `levelist`."""
+        raise NotImplementedError()
+
+    def split_levels(self) -> List[FieldCube]:
+        """Returns one cube per level (always the same objects)."""
+        raise NotImplementedError()
+
+    def __contains__(self, key: tuple) -> bool:
+        time, levelist = key
+        return time in self.times and levelist in self.levels
+
+    def __len__(self):
+        return len(self.times) * len(self.levels)
+
+    @property
+    def name(self) -> str:
+        return self.first.name
+
+    @property
+    def group_name(self) -> str:
+        return self.first.group_name
+
+    @property
+    def title(self) -> str:
+        return self.first.title
+
+    @property
+    def group_title(self) -> str:
+        return self.first.group_title
+
+    @property
+    def time(self):
+        return self.first.time
+
+    @property
+    def levelist(self):
+        return self.first.levelist
+
+    @property
+    def styles(self):
+        return self.first.styles
+
+
 class FieldReader(ABC):
     """Get WMS layers (fields) from a file."""
 
@@ -180,6 +256,11 @@ class FieldReader(ABC):
 
 
 class Layer:
+
+    # True if the rendering of the layer does not depend on data,
+    # e.g. coastlines or boundaries
+    static = False
+
     def __init__(
         self,
         name: str,
@@ -385,12 +466,21 @@ class DataLayer(Layer):
             and field.time == field.time.astimezone(tz=datetime.timezone.utc)
         )
         assert field.levelist is None or isinstance(field.levelist, int)
-        self._first = field
 
-        self._fields = {(field.time, field.levelist): field}
+        # fields by (time, levelist), and cubes of fields created on demand
+        self._fields = {}
+        self._cubes = []
+        if isinstance(field, FieldCube):
+            self._first = field.first
+            self._cubes.append(field)
+        else:
+            self._first = field
+            self._fields[(field.time, field.levelist)] = field
 
         self._time_dimension_is_none = field.time is None
-        self._times = None
+
+        # sorted available times, and available levels of each time
+        self._times, self._levels = _index_fields(self._fields, self._cubes)
 
     def select_nearest_available_time(
         self, time: datetime.datetime
@@ -404,16 +494,15 @@ class DataLayer(Layer):
         Returns:
             datetime.datetime: the nearest available time less than or equal to 'time'
         """
-        nearest_time = None
-        for atime in self.available_times():
-            if time is None:
-                return atime
+        times = self._times
+        if not times:
+            return None
 
-            if atime <= time:
-                nearest_time = atime
-            else:
-                return nearest_time
-        return nearest_time
+        if time is None:
+            return times[0]
+
+        i = bisect.bisect_right(times, time)
+        return times[i - 1] if i > 0 else None
 
     def available_times(self) -> List[datetime.datetime]:
         """Returns a sorted list of all available times. Returns an empty list, if no time dimension is available.
@@ -421,8 +510,7 @@ class DataLayer(Layer):
         Returns:
             List[datetime.datetime]: a sorted list of all available times
         """
-        times = sorted({l[0] for l in self._fields.keys() if l[0] is not None})
-        return times
+        return list(self._times)
 
     def available_elevations(self) -> List[int]:
         """Return a sorted list of all available elevations. Returns an empty list, if no elevation dimension is available.
@@ -431,7 +519,12 @@ class DataLayer(Layer):
             List[int]: a sorted list of all available elevations
         """
         elevations = sorted(
-            {str(l[1]) for l in self._fields.keys() if l[1] is not None}
+            {
+                str(levelist)
+                for levels in self._levels.values()
+                for levelist in levels
+                if levelist is not None
+            }
         )
         return elevations
 
@@ -446,6 +539,54 @@ class DataLayer(Layer):
         return self._group_dimensions
 
     def add_field(self, field: Field) -> None:
+        self._add_field(self._fields, self._cubes, field)
+
+        if isinstance(field, FieldCube):
+            keys = [(time, field.levels) for time in field.times]
+        else:
+            keys = [(field.time, (field.levelist,))]
+
+        for time, levelists in keys:
+            levels = self._levels.get(time)
+            if levels is None:
+                levels = self._levels[time] = set()
+                if time is not None:
+                    bisect.insort(self._times, time)
+            levels.update(levelists)
+
+    def update_fields(self, add: List[Field], remove: List[Field]) -> None:
+        """Adds and removes fields, e.g. when a data file has been added, modified
+        or deleted. The fields are updated in a copy that then replaces the current
+        ones, so that concurrent readers are never blocked nor see a partial update.
+
+        :param add: the fields to add to this layer
+        :type add: List[Field]
+        :param remove: the fields to remove from this layer
+        :type remove: List[Field]
+        """
+        fields = dict(self._fields)
+        cubes = list(self._cubes)
+        for field in remove:
+            if isinstance(field, FieldCube):
+                cubes = [cube for cube in cubes if cube is not field]
+                continue
+            key = (field.time, field.levelist)
+            if fields.get(key) is field:
+                del fields[key]
+
+        for field in add:
+            self._add_field(fields, cubes, field)
+
+        firsts = list(fields.values()) + [cube.first for cube in cubes]
+        if firsts and not any(first is self._first for first in firsts):
+            self._first = firsts[0]
+
+        self._times, self._levels = _index_fields(fields, cubes)
+        self._fields, self._cubes = fields, cubes
+
+    def _add_field(
+        self, fields: Dict[tuple, Field], cubes: List[FieldCube], field: Field
+    ) -> None:
         if self._group_dimensions:
             assert self.name == field.group_name
 
@@ -467,7 +608,7 @@ class DataLayer(Layer):
             )
             assert field.levelist is None or isinstance(field.levelist, int)
 
-            if (field.time, field.levelist) in self._fields:
+            if (field.time, field.levelist) in fields:
                 LOG.info(
                     "Duplicate field (time: %s, elevation: %s) in %s (%s, %s)"
                     % (
@@ -475,7 +616,7 @@ class DataLayer(Layer):
                         field.levelist,
                         self,
                         field,
-                        self._fields[(field.time, field.levelist)],
+                        fields[(field.time, field.levelist)],
                     )
                 )
 
@@ -484,7 +625,10 @@ class DataLayer(Layer):
                 #     "Duplicate date %s in %s (%s, %s)"
                 #     % (field.time, self, field, self._fields[field.time])
                 # )
-            self._fields[(field.time, field.levelist)] = field
+            if isinstance(field, FieldCube):
+                cubes.append(field)
+            else:
+                fields[(field.time, field.levelist)] = field
 
         else:  # don't group levels
             assert self.name == field.name
@@ -507,7 +651,7 @@ class DataLayer(Layer):
             )
             assert field.levelist is None or isinstance(field.levelist, int)
 
-            if (field.time, field.levelist) in self._fields:
+            if (field.time, field.levelist) in fields:
                 LOG.info(
                     "Duplicate field (time: %s, elevation: %s) in %s (%s, %s)"
                     % (
@@ -515,7 +659,7 @@ class DataLayer(Layer):
                         field.levelist,
                         self,
                         field,
-                        self._fields[(field.time, field.levelist)],
+                        fields[(field.time, field.levelist)],
                     )
                 )
 
@@ -525,7 +669,10 @@ class DataLayer(Layer):
                 #     % (field.time, self, field, self._fields[field.time])
                 # )
 
-            self._fields[(field.time, field.levelist)] = field
+            if isinstance(field, FieldCube):
+                cubes.append(field)
+            else:
+                fields[(field.time, field.levelist)] = field
 
     @property
     def fixed_layer(self) -> bool:
@@ -595,13 +742,11 @@ class DataLayer(Layer):
 
             # check if the given time exists
             time = self.select_nearest_available_time(time)
-            valid_elevations = {
-                i[1] for i in self._fields.keys() if TimeDimension.equals(i[0], time)
-            }
+            valid_elevations = set(self._levels.get(time, ()))
             if len(valid_elevations) < 1:
                 raise KeyError(
                     "(%s,%s) TIME not found. Available combinations: %s"
-                    % (time, elevation, self._fields.keys())
+                    % (time, elevation, self._levels)
                 )
                 # selected time not found, fallback to a valid time
                 # time = self._first.time
@@ -615,21 +760,41 @@ class DataLayer(Layer):
             if elevation not in valid_elevations:
                 elevation = valid_elevations.pop()
 
-        if (time, elevation) not in self._fields.keys():
-            raise KeyError(
-                "(%s,%s) not found. Available combinations: %s"
-                % (time, elevation, self._fields.keys())
-            )
+        field = self._fields.get((time, elevation))
+        if field is not None:
+            return field
+
+        # the fields of cubes are only created when selected
+        for cube in reversed(self._cubes):
+            if (time, elevation) in cube:
+                return cube.field(time, elevation)
 
-        return self._fields[(time, elevation)]
+        raise KeyError(
+            "(%s,%s) not found. Available combinations: %s"
+            % (time, elevation, self._levels)
+        )
 
     def as_dict(self):
         return dict(
             _class=self.__class__.__module__ + "." + self.__class__.__name__,
             fields=[field.as_dict() for _, field in sorted(self._fields.items())],
+            cubes=[cube.as_dict() for cube in self._cubes],
         )
 
 
+def _index_fields(fields: Dict[tuple, Field], cubes: List[FieldCube] = ()) -> tuple:
+    """Returns the sorted list of the times of `fields` and `cubes`, and a
+    dictionary of the levels available at each time."""
+    levels = {}
+    for time, levelist in fields:
+        levels.setdefault(time, set()).add(levelist)
+    for cube in cubes:
+        for time in cube.times:
+            levels.setdefault(time, set()).update(cube.levels)
+    times = sorted(time for time in levels if time is not None)
+    return times, levels
+
+
 class Availability:
     def __init__(
         self, auto_add_plotter_layers: bool = True, group_dimensions: bool = False
@@ -639,6 +804,7 @@ class Availability:
         self._aliases = {}
         self._auto_add_plotter_layers = auto_add_plotter_layers
         self._group_dimensions = group_dimensions
+        self._generation = 0
 
     @property
     def context(self) -> WMSServer:
@@ -662,6 +828,15 @@ class Availability:
     def auto_add_plotter_layers(self) -> bool:
         return self._auto_add_plotter_layers
 
+    @property
+    def generation(self) -> int:
+        """A number that changes every time layers or fields are added or removed."""
+        return self._generation
+
+    def layer_name(self, field: Field) -> str:
+        """Returns the name of the layer a field belongs to."""
+        return field.group_name if self._group_dimensions else field.name
+
     def add_field(self, field: Field) -> None:
         """Adds a data field to the list of available layers.
 
@@ -673,6 +848,13 @@ class Availability:
         """
         # TODO: Use config....
 
+        if isinstance(field, FieldCube):
+            split = self._split_levels([field])
+            if split != [field]:
+                for cube in split:
+                    self.add_field(cube)
+                return
+
         if self._group_dimensions:
             if not self._layers:
                 self._aliases["default"] = field.group_name
@@ -698,6 +880,60 @@ class Availability:
                     field, group_dimensions=self.group_dimensions
                 )
 
+        self._generation += 1
+
+    def _split_levels(self, fields: List[Field]) -> List[Field]:
+        # without grouping, each level of a cube is a layer of its own
+        if self._group_dimensions:
+            return fields
+        result = []
+        for field in fields:
+            if isinstance(field, FieldCube) and len(field.levels) > 1:
+                result.extend(field.split_levels())
+            else:
+                result.append(field)
+        return result
+
+    def update_fields(self, add: List[Field], remove: List[Field]) -> None:
+        """Adds and removes fields, e.g. when a data file has been added, modified
+        or deleted, while the layers are in use. Layers left without fields are
+        removed. See also DataLayer.update_fields.
+
+        :param add: the fields to be added
+        :type add: List[Field]
+        :param remove: the fields to be removed
+        :type remove: List[Field]
+        """
+        added = {}
+        for field in self._split_levels(add):
+            added.setdefault(self.layer_name(field), []).append(field)
+
+        removed = {}
+        for field in self._split_levels(remove):
+            removed.setdefault(self.layer_name(field), []).append(field)
+
+        layers = dict(self._layers)
+        for name in sorted(set(added) | set(removed)):
+            fields = added.get(name, [])
+            layer = layers.get(name)
+            if layer is None:
+                if not fields:
+                    continue
+                layer = DataLayer(fields[0], group_dimensions=self.group_dimensions)
+                for field in fields[1:]:
+                    layer.add_field(field)
+                layers[name] = layer
+            else:
+                layer.update_fields(fields, removed.get(name, []))
+                if not layer._fields and not layer._cubes:
+                    del layers[name]
+
+        if layers and self._aliases.get("default") not in layers:
+            self._aliases["default"] = next(iter(layers))
+
+        self._layers = layers
+        self._generation += 1
+
     def layers(self):
         if not self._layers:
             self.load()
@@ -706,14 +942,20 @@ class Availability:
         ret.sort(key=lambda x: x.name, reverse=False)
         return ret
 
+    def resolve(self, name: str) -> str:
+        """Returns the name of the layer that `name` is an alias of (e.g.
+        'default'), or `name` itself."""
+        while name in self._aliases:
+            name = self._aliases[name]
+        return name
+
     def layer(self, name, dims):
         if not self._layers:
             self.load()
 
         LOG.info("Look up layer with name %s and dims %s", name, dims)
 
-        while name in self._aliases:
-            name = self._aliases[name]
+        name = self.resolve(name)
 
         if name not in self._layers:
             raise errors.LayerNotDefined("Unknown layer '{}'".format(name))
@@ -721,6 +963,17 @@ class Availability:
         # TODO: select on othe dimenstions as well
         return self._layers[name].select(dims)
 
+    def available_times(self, name: str) -> List[datetime.datetime]:
+        """Returns the sorted list of the times of a layer, or an empty list if
+        the layer is unknown or has no time dimension.
+        """
+        name = self.resolve(name)
+
+        layer = self._layers.get(name)
+        if layer is None:
+            return []
+        return layer.available_times()
+
     def as_dict(self):
         if not self._layers:
             self.load()
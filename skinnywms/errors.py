@@ -20,6 +20,7 @@ __all__ = [
     "MissingDimensionValue",
     "OperationNotSupported",
     "ServiceNotDefined",
+    "ServiceUnavailable",
     "StyleNotDefined",
     "version_param",
     "wrap",
@@ -55,6 +56,9 @@ _TEMPLATE_1_3_0 = """
 class WMSError(Exception):
     """Base class for WMS errors."""
 
+    # WMS exceptions are reported with a 200 status, as the standard requires
+    status = 200
+
     def __init__(self, message):
         super(WMSError, self).__init__(message)
 
@@ -166,6 +170,15 @@ class ServiceNotDefined(WMSError):
     """The requested service is not available in this service instance."""
 
 
+class ServiceUnavailable(GenericError):
+    """The service instance is too busy to process the request. This is not
+    a WMS exception code, the error is reported without a code.
+
+    """
+
+    status = 503
+
+
 class StyleNotDefined(WMSError):
     """Request is for a Layer in a Style not offered by the service
     instance.
@@ -8,6 +8,7 @@
 
 import datetime
 import logging
+import sys
 import weakref
 from threading import settrace
 from typing import Dict
@@ -31,35 +32,79 @@ possible_matches = {}
 which is filled during init process"""
 
 
+# values used by many fields (e.g. the keys of their mars requests), so
+# that the fields share one copy of them
+_shared = {}
+
+
+def _share(value):
+    return _shared.setdefault(value, value)
+
+
+def _pack(values: dict, share: bool = False) -> tuple:
+    """Returns the keys and the values of a dictionary as two tuples, with
+    interned strings. The tuples of values are only shared if `share`
+    is set, e.g. for values that do not change with the time of fields."""
+    keys = _share(tuple(values))
+    values = tuple(sys.intern(v) if isinstance(v, str) else v for v in values.values())
+    return keys, _share(values) if share else values
+
+
+def forget_possible_matches(path: str) -> None:
+    """Forgets the unmatched fields of a file, e.g. before it is scanned again."""
+    for name, fields in list(possible_matches.items()):
+        possible_matches[name] = [f for f in fields if f.path != path]
+
+
 class GRIBField(datatypes.Field):
 
     log = logging.getLogger(__name__)
 
+    # there is one field per GRIB message, and there can be hundreds of
+    # thousands of them
+    __slots__ = (
+        "path",
+        "index",
+        "byte_offset",
+        "time",
+        "levtype",
+        "shortName",
+        "longName",
+        "levelist",
+        "styles",
+        "ucomponent",
+        "vcomponent",
+        "_mars",
+        "_metadata",
+        "_companion",
+        "_context",
+    )
+
     def __init__(self, context: WMSServer, path: str, grib: GribField, index: int):
         super(datatypes.Field, self).__init__()
 
         self.path = path
         self.index = index
         self.mars = grib.mars_request
-        self.render = self.render_contour
         self.byte_offset = grib.byte_offset
 
         self.metadata = grib.metadata
 
         self.context = context
 
+        valid_date = grib.valid_date
         self.time = (
-            grib.valid_date
-            if grib.valid_date is None
-            else grib.valid_date.astimezone(tz=datetime.timezone.utc)
+            valid_date
+            if valid_date is None
+            else valid_date.astimezone(tz=datetime.timezone.utc)
         )
 
-        self.levtype = grib.levtype
+        self.levtype = sys.intern(grib.levtype)
         if self.levtype == "150":
             self.levtype = "ml"  # DWD ICON hack
 
-        self.shortName = grib.shortName
-        self.longName = grib.name
+        self.shortName = sys.intern(grib.shortName)
+        self.longName = sys.intern(grib.name)
         self.levelist = (
             grib.levelist
             if hasattr(grib, "levelist") and grib.levtype != "sfc"
@@ -103,25 +148,31 @@ class GRIBField(datatypes.Field):
                 self
             )
 
+    @property
+    def mars(self) -> Dict[str, str]:
+        return dict(zip(*self._mars))
+
+    @mars.setter
+    def mars(self, mars: Dict[str, str]):
+        self._mars = _pack(mars)
+
     @property
     def metadata(self) -> Dict[str, str]:
         if self.companion is None:
-            return self._metadata
+            return dict(zip(*self._metadata))
         else:
             joined_meta = {}
-            common_keys = set(self.ucomponent._metadata.keys()).intersection(
-                set(self.vcomponent._metadata.keys())
-            )
+            umeta = dict(zip(*self.ucomponent._metadata))
+            vmeta = dict(zip(*self.vcomponent._metadata))
+            common_keys = set(umeta.keys()).intersection(set(vmeta.keys()))
             for key in common_keys:
-                joined_meta[key] = "%s/%s" % (
-                    self.ucomponent._metadata[key],
-                    self.vcomponent._metadata[key],
-                )
+                joined_meta[key] = "%s/%s" % (umeta[key], vmeta[key])
             return joined_meta
 
     @metadata.setter
     def metadata(self, metadata: Dict[str, str]):
-        self._metadata = metadata
+        # the metadata does not depend on the time of the field
+        self._metadata = _pack(metadata, share=True)
 
     @property
     def context(self) -> WMSServer:
@@ -135,6 +186,27 @@ class GRIBField(datatypes.Field):
     def context(self, context: WMSServer):
         self._context = weakref.ref(context)
 
+    def set_context(self, context: WMSServer) -> None:
+        self.context = context
+        # share the styles with the fields of the other files
+        key = "style.grib.%s" % (self.name,)
+        self.styles = context.stash.setdefault(key, self.styles)
+
+    def __getstate__(self):
+        # the server context is not persisted with the field, see set_context()
+        return {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if name != "_context" and hasattr(self, name)
+        }
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        # share with the fields restored from other files
+        self._mars = (_share(self._mars[0]), self._mars[1])
+        self._metadata = tuple(_share(x) for x in self._metadata)
+
     def matches(self, other) -> bool:
         """Check if companion has matching grib properties (filename, time, levtype and levelist).
 
@@ -173,10 +245,6 @@ class GRIBField(datatypes.Field):
         companion.ucomponent = self.ucomponent
         companion.vcomponent = self.vcomponent
 
-        # render these fields as wind
-        self.render = self.render_wind
-        companion.render = companion.render_wind
-
         key = "style.grib.%s" % (self.name,)
         self.styles = self.context.stash[key] = (
             self.context.styler.grib_styles_from_meta(self)
@@ -243,6 +311,12 @@ class GRIBField(datatypes.Field):
                 titleSuffix,
             )
 
+    def render(self, context, driver, style, legend={}) -> list:
+        # fields with a companion are rendered as wind
+        if self.companion is None:
+            return self.render_contour(context, driver, style, legend)
+        return self.render_wind(context, driver, style, legend)
+
     def render_contour(self, context, driver, style, legend={}) -> list:
         data = []
         params = dict(
@@ -313,9 +387,13 @@ class GRIBReader(datatypes.FieldReader):
     def get_fields(self) -> list:
         self.log.info("Scanning file: %s", self.path)
 
+        # the file may have been scanned before, and modified since then
+        forget_possible_matches(self.path)
+
         fields = set()
 
-        for i, m in enumerate(grib_bindings.GribFile(self.path)):
+        # only the headers are needed to describe the fields
+        for i, m in enumerate(grib_bindings.GribFile(self.path, headers_only=True)):
             fields.add(GRIBField(self.context, self.path, m, i))
 
         if not fields:
@@ -6,13 +6,13 @@
 # granted to it by virtue of its status as an intergovernmental organisation nor
 # does it submit to any jurisdiction.
 
+import copy
 import datetime
 import logging
 import os
-from contextlib import closing
-from itertools import product
 
-import xarray as xr
+import netCDF4
+import numpy as np
 from dateutil import parser
 
 from skinnywms import datatypes
@@ -33,6 +33,20 @@ def as_datetime(self, time):
         return parser.parse(str(time)[:19]).replace(tzinfo=datetime.timezone.utc)
 
 
+def as_datetimes(self, values) -> list:
+    """Converts an array of times to UTC datetimes, in bulk for datetime64
+    values, rather than by formatting and parsing each of them."""
+    values = np.asarray(values)
+    if not np.issubdtype(values.dtype, np.datetime64):
+        return [as_datetime(self, t) for t in values]
+
+    # Lose the nano-seconds.... always assume times in UTC
+    return [
+        t.replace(tzinfo=datetime.timezone.utc)
+        for t in values.astype("datetime64[s]").tolist()
+    ]
+
+
 def as_level(self, level):
     n = float(level)
     if int(n) == n:
@@ -40,6 +54,112 @@ def as_level(self, level):
     return n
 
 
+# calendars whose dates are numpy.datetime64 dates
+STANDARD_CALENDARS = ("standard", "gregorian", "proleptic_gregorian")
+
+
+def decode_times(values, units: str, calendar: str = None) -> np.ndarray:
+    """Decodes CF times, e.g. hours since a date, into datetime64 values, or
+    into cftime dates for the other calendars (e.g. 'noleap'), as xarray."""
+    calendar = (calendar or "standard").lower()
+    if calendar in STANDARD_CALENDARS:
+        try:
+            dates = netCDF4.num2date(
+                values,
+                units,
+                calendar=calendar,
+                only_use_cftime_datetimes=False,
+                only_use_python_datetimes=True,
+            )
+            return np.asarray(dates, dtype="datetime64[ns]")
+        except ValueError:
+            # e.g. dates before the Gregorian reform
+            pass
+
+    dates = netCDF4.num2date(
+        values, units, calendar=calendar, only_use_cftime_datetimes=True
+    )
+    return np.asarray(dates, dtype=object)
+
+
+class NetCDFVariable:
+    """The metadata of a variable of a NetCDF file: its name, dimensions and
+    attributes (also available as Python attributes, as with xarray) and, for
+    coordinates, its values.
+    """
+
+    def __init__(self, name: str, dims: tuple, attrs: dict, values=None):
+        self.name = name
+        self.dims = dims
+        self.attrs = attrs
+        self.values = values
+        self.coords = []
+
+    def __getattr__(self, name):
+        attrs = self.__dict__.get("attrs", {})
+        if name in attrs:
+            return attrs[name]
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return "NetCDFVariable[%s%s]" % (self.name, self.dims)
+
+
+class NetCDFMetadata:
+    """The variables of a NetCDF file, with the values of the coordinates
+    only. This is the subset of an xarray dataset used to find the fields of a
+    file, read directly with netCDF4, without loading any data.
+
+    As with xarray, the coordinates are the variables named after their
+    dimension, and the variables named in the `coordinates` attribute of
+    other variables. The coordinates of a variable are the ones whose
+    dimensions are dimensions of the variable.
+    """
+
+    def __init__(self, path: str):
+        self.variables = {}
+
+        with netCDF4.Dataset(path, "r") as nc:
+            coords = set()
+            for name, var in nc.variables.items():
+                if var.dimensions == (name,):
+                    coords.add(name)
+                coordinates = getattr(var, "coordinates", "")
+                if isinstance(coordinates, str):
+                    coords.update(c for c in coordinates.split() if c in nc.variables)
+
+            for name, var in nc.variables.items():
+                attrs = {a: var.getncattr(a) for a in var.ncattrs()}
+                values = None
+                if name in coords:
+                    values = self._read_values(var, attrs)
+                self.variables[name] = NetCDFVariable(
+                    name, tuple(var.dimensions), attrs, values
+                )
+
+        self.data_vars = [name for name in self.variables if name not in coords]
+
+        for name in self.data_vars:
+            v = self.variables[name]
+            dims = set(v.dims)
+            v.coords = [
+                c
+                for c in self.variables
+                if c in coords and dims.issuperset(self.variables[c].dims)
+            ]
+
+    def _read_values(self, var, attrs):
+        var.set_auto_mask(False)
+        values = np.asarray(var[...])
+        units = attrs.get("units")
+        if isinstance(units, str) and " since " in units:
+            values = decode_times(values, units, attrs.get("calendar"))
+        return values
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+
 class Slice:
     def __init__(self, name, value, index, is_dimension, is_info):
         self.name = name
@@ -84,17 +204,34 @@ class Coordinate:
         if variable.values.ndim == 0:
             self.values = [self.convert(variable.values)]
         else:
-            self.values = [self.convert(t) for t in variable.values]
+            self.values = self.convert_all(variable.values)
+
+        # index of the (first occurrence of) each value
+        self.indices = {}
+        for i, value in enumerate(self.values):
+            self.indices.setdefault(value, i)
+
+        self._slices = None
+
+    def convert_all(self, values) -> list:
+        return [self.convert(v) for v in values]
 
     def make_slice(self, value):
         return self.slice_class(
             self.variable.name,
             value,
-            self.values.index(value),
+            self.indices[value],
             self.is_dimension,
             self.is_info,
         )
 
+    @property
+    def slices(self) -> list:
+        """The slices of all the values, shared by the fields of a variable."""
+        if self._slices is None:
+            self._slices = [self.make_slice(value) for value in self.values]
+        return self._slices
+
     def __repr__(self):
         return "%s[name=%s,values=%s]" % (
             self.__class__.__name__,
@@ -107,6 +244,7 @@ class TimeCoordinate(Coordinate):
     slice_class = TimeSlice
     is_dimension = True
     convert = as_datetime
+    convert_all = as_datetimes
 
 
 class ModelLevelCoordinate(Coordinate):
@@ -131,11 +269,32 @@ class OtherCoordinate(Coordinate):
     convert = as_level
 
 
+def variable_titles(context, ds, variable) -> tuple:
+    """Returns the long name and the legend title of the fields of a
+    variable."""
+    long_name = getattr(
+        ds[variable],
+        "long_name",
+        getattr(ds[variable], "standard_name", variable),
+    )
+
+    magics_prefix = "magics"
+
+    if hasattr(context, magics_prefix):
+        magics_prefix = context.magics_prefix
+
+    legend_title = getattr(
+        ds[variable], "{}_legend_title_text".format(magics_prefix), long_name
+    )
+
+    return long_name, legend_title
+
+
 class NetCDFField(datatypes.Field):
 
     log = logging.getLogger(__name__)
 
-    def __init__(self, context, path, ds, variable, slices):
+    def __init__(self, context, path, ds, variable, slices, titles=None, styles=None):
 
         self.path = path
         self.variable = variable
@@ -144,25 +303,15 @@ class NetCDFField(datatypes.Field):
         self.shortName = self.variable
         self.companion = None  # not yet supported for netCDF
 
-        self.longName = getattr(
-            ds[self.variable],
-            "long_name",
-            getattr(ds[self.variable], "standard_name", self.variable),
-        )
+        # the same for all the fields of a variable, see variable_titles()
+        if titles is None:
+            titles = variable_titles(context, ds, variable)
+        self.longName, self.legend_title = titles
 
         self.levelist = None
         # if level:
         #     self.name += '_' + str(level)
 
-        magics_prefix = "magics"
-
-        if hasattr(context, magics_prefix):
-            magics_prefix = context.magics_prefix
-
-        self.legend_title = getattr(
-            ds[self.variable], "{}_legend_title_text".format(magics_prefix), self.title
-        )
-
         # if level:
         #     self.title += ' @ ' + str(level)
 
@@ -181,6 +330,11 @@ class NetCDFField(datatypes.Field):
                 self.levelist = s.value
                 self.levtype = "ml"
 
+        if styles is not None:
+            # shared by the fields of a variable, see NetCDFCube
+            self.styles = styles
+            return
+
         key = "style.netcdf.%s" % (self.name,)
 
         # Optimisation
@@ -293,6 +447,120 @@ class NetCDFField(datatypes.Field):
         )
 
 
+class NetCDFCube(datatypes.FieldCube):
+    """The fields of a NetCDF variable, for all the combinations of its
+    coordinates. Only the coordinates are kept, and the field of a time and a
+    level is created when it is selected.
+
+    As when all the fields are listed, the time and the level of the fields
+    are the ones of the last time and level coordinates, and the other
+    coordinates are set to their last value.
+    """
+
+    def __init__(self, context, path, ds, variable, coordinates, titles=None):
+        self.path = path
+        self.variable = variable
+        self.coordinates = coordinates
+        if titles is None:
+            titles = variable_titles(context, ds, variable)
+        self.titles = titles
+
+        self._time = None
+        self._level = None
+        for i, coordinate in enumerate(coordinates):
+            if isinstance(coordinate, TimeCoordinate):
+                self._time = i
+            elif isinstance(
+                coordinate, (PressureLevelCoordinate, ModelLevelCoordinate)
+            ):
+                self._level = i
+
+        self._times = self._axis(self._time)
+        self._levels = self._axis(self._level)
+        self._split = None
+
+        # the styles of the first field are shared by all of them
+        self.first = NetCDFField(
+            context,
+            path,
+            ds,
+            variable,
+            self.slices(self._times[0], self._levels[0]),
+            titles,
+        )
+
+    def _axis(self, i):
+        if i is None:
+            return [None]
+        # unique values, see Coordinate.indices
+        return list(self.coordinates[i].indices)
+
+    @property
+    def times(self) -> list:
+        return self._times
+
+    @property
+    def levels(self) -> list:
+        return self._levels
+
+    def slices(self, time, levelist) -> list:
+        slices = [coordinate.slices[-1] for coordinate in self.coordinates]
+        for i, value in ((self._time, time), (self._level, levelist)):
+            if i is not None:
+                coordinate = self.coordinates[i]
+                slices[i] = coordinate.slices[coordinate.indices[value]]
+        return slices
+
+    def field(self, time, levelist) -> NetCDFField:
+        return NetCDFField(
+            None,
+            self.path,
+            None,
+            self.variable,
+            self.slices(time, levelist),
+            self.titles,
+            styles=self.first.styles,
+        )
+
+    def split_levels(self) -> list:
+        if len(self._levels) == 1:
+            return [self]
+
+        if self._split is None:
+            split = []
+            for levelist in self._levels:
+                cube = copy.copy(self)
+                cube._levels = [levelist]
+                cube.first = self.field(self._times[0], levelist)
+                split.append(cube)
+            self._split = split
+
+        return self._split
+
+    def __contains__(self, key: tuple) -> bool:
+        time, levelist = key
+        for i, value in ((self._time, time), (self._level, levelist)):
+            if i is None:
+                if value is not None:
+                    return False
+            elif value not in self.coordinates[i].indices:
+                return False
+        return self._level is None or levelist in self._levels
+
+    def __repr__(self):
+        return "NetCDFCube[%r,%r]" % (self.variable, self.coordinates)
+
+    def as_dict(self):
+        return dict(
+            _class=self.__class__.__module__ + "." + self.__class__.__name__,
+            name=self.name,
+            path=self.path,
+            variable=self.variable,
+            coordinates=[repr(c) for c in self.coordinates],
+            fields=len(self),
+        )
+
+
 class NetCDFReader(datatypes.FieldReader):
     """Get WMS layers from a NetCDF file."""
 
@@ -303,8 +571,8 @@ class NetCDFReader(datatypes.FieldReader):
         self.log.info("__init__")
 
     def get_fields(self):
-        with closing(xr.open_mfdataset(self.path)) as ds:
-            return self._get_fields(ds)
+        # only the metadata is needed to find the fields
+        return self._get_fields(NetCDFMetadata(self.path))
 
     def _get_fields(self, ds):
         # Select only geographical variables
@@ -388,18 +656,18 @@ class NetCDFReader(datatypes.FieldReader):
                 self.log.info("NetCDFReader: skip %s (Not a 2 field)", name)
                 continue
 
-            for values in product(*[c.values for c in coordinates]):
+            self.log.info("NetCDFReader: %s %s", name, coordinates)
 
-                slices = []
-                for value, coordinate in zip(values, coordinates):
-                    self.log.info("COORDINATE %s:%s" % (coordinate, value))
-                    slices.append(coordinate.make_slice(value))
-
-                fields.append(NetCDFField(self.context, self.path, ds, name, slices))
+            # the fields are only created when selected
+            fields.append(NetCDFCube(self.context, self.path, ds, name, coordinates))
 
         if not fields:
             raise Exception("NetCDFReader no 2D fields found in %s", self.path)
 
-        self.log.info("Scanning file <=== : %s (fields=%s)", self.path, len(fields))
+        self.log.info(
+            "Scanning file <=== : %s (fields=%s)",
+            self.path,
+            sum(len(cube) for cube in fields),
+        )
 
         return fields
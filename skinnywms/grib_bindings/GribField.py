@@ -8,24 +8,127 @@
 #
 
 import datetime
+import threading
+from collections import OrderedDict
 from typing import Dict
 
 import numpy as np
 
+from ..grids import reduced_grid
 from .bindings import (
+    METADATA_KEYS,
     grib_get,
     grib_get_code,
     grib_get_gaussian_latitudes,
     grib_get_keys_values,
-    grib_get_metadata,
     grib_get_size,
     grib_handle_delete,
     grib_pl_array,
     grib_values,
 )
 
-REGULAR_CACHE = {}
-REDUCED_CACHE = {}
+MISSING = object()
+
+
+class GridCache(object):
+    """A thread-safe LRU cache of the coordinates of grid geometries, bounded
+    in bytes and shared by all the fields.
+
+    :param max_bytes: maximum size of the cached coordinate arrays
+    :param dtype: type of the cached floating point arrays, e.g. np.float32
+        to halve the memory used by high resolution grids
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, dtype=np.float64):
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the coordinates and attributes of a grid, or (None, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, coords: dict, attributes: dict):
+        """Caches the coordinates of a grid, and returns them as cached."""
+        coords = {name: self._convert(value) for name, value in coords.items()}
+        size = sum(_nbytes(value) for value in coords.values())
+        if size > self.max_bytes:
+            return coords, attributes
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[2]
+            self._entries[key] = (coords, attributes, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted[2]
+                self.evictions += 1
+
+        return coords, attributes
+
+    def configure(self, max_bytes: int = None, dtype=None) -> None:
+        """Changes the size and the type of the arrays of the cache (e.g. from
+        the server options). Grids cached with another type are dropped."""
+        with self._lock:
+            if dtype is not None and np.dtype(dtype) != np.dtype(self.dtype):
+                self.dtype = dtype
+                self._entries.clear()
+                self._size = 0
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted[2]
+                self.evictions += 1
+
+    def _convert(self, value):
+        if isinstance(value, tuple):
+            return tuple(self._convert(v) for v in value)
+        if isinstance(value, np.ndarray) and value.dtype.kind == "f":
+            return value.astype(self.dtype, copy=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return dict(
+            entries=len(self._entries),
+            bytes=self._size,
+            max_bytes=self.max_bytes,
+            dtype=np.dtype(self.dtype).name,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+def _nbytes(value):
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    return getattr(value, "nbytes", 0)
+
+
+GRID_CACHE = GridCache()
 
 
 class Regular(object):
@@ -36,8 +139,8 @@ class Regular(object):
 
     def coordinates(self, grib, coords, combine_order, attributes, dims):
 
-        key = self.cache_key(grib)
-        _coords, _attributes = REGULAR_CACHE.get(key, (None, None))
+        key = (self.__class__.__name__,) + self.cache_key(grib)
+        _coords, _attributes = GRID_CACHE.get(key)
 
         if _coords is None:
 
@@ -54,7 +157,7 @@ class Regular(object):
                 long_name="Longitude", units="degrees_east", standard_name="longitude"
             )
 
-        REGULAR_CACHE[key] = (_coords, _attributes)
+            _coords, _attributes = GRID_CACHE.put(key, _coords, _attributes)
 
         coords.update(_coords)
         attributes.update(_attributes)
@@ -118,16 +221,6 @@ class RegularGG(Regular):
         )
 
 
-def reduced_grid(pl_array, latitudes):
-    for pl, lat in zip(pl_array, latitudes):
-        if pl == 0:
-            continue
-
-        for n in range(0, pl):
-            lon = (360.0 * n) / pl
-            yield lat, lon
-
-
 class Reduced(object):
     def array(self, grib):
         assert grib.scanningMode == 0
@@ -135,23 +228,17 @@ class Reduced(object):
 
     def coordinates(self, grib, coords, combine_order, attributes, dims):
 
-        key = self.cache_key(grib)
-        _coords, _attributes = REDUCED_CACHE.get(key, (None, None))
+        key = (self.__class__.__name__,) + self.cache_key(grib)
+        _coords, _attributes = GRID_CACHE.get(key)
 
         if _coords is None:
 
             _coords = {}
             _attributes = {}
 
-            # TODO: that may not be the fastest way...
             n = grib.numberOfDataPoints
-            lats = np.ndarray((n,))
-            lons = np.ndarray((n,))
-            i = 0
-            for lat, lon in reduced_grid(grib.pl_array, self.latitudes(grib)):
-                lats[i] = lat
-                lons[i] = lon
-                i = i + 1
+            lats, lons = reduced_grid(grib.pl_array, self.latitudes(grib))
+            assert len(lats) == n, (len(lats), n)
 
             _coords["latitude"] = ("rgrid", lats.reshape((n,)))
             _attributes["latitude"] = dict(
@@ -173,12 +260,12 @@ class Reduced(object):
             # We use rgrid:latdim and rgrid:londim to pass the information that will
             # be used when saving to netcdf
 
-            _coords["rgrid"] = np.array(range(0, n))
+            _coords["rgrid"] = np.arange(n)
             _attributes["rgrid"] = dict(
                 compress="latdim londim", latdim=latdim, londim=londim
             )
 
-            REDUCED_CACHE[key] = (_coords, _attributes)
+            _coords, _attributes = GRID_CACHE.put(key, _coords, _attributes)
 
         coords.update(_coords)
         attributes.update(_attributes)
@@ -303,6 +390,10 @@ class GribField(object):
     def __init__(self, handle, path, offset):
         self._handle = handle
 
+        # Values of the keys already read from the handle: the same keys
+        # are used many times when a field is scanned
+        self._keys = {}
+
         self._path = path
         self._offset = offset
 
@@ -334,7 +425,11 @@ class GribField(object):
 
     @property
     def metadata(self) -> Dict[str, str]:
-        return grib_get_metadata(self._handle)
+        ret = {}
+        for name, value in zip(METADATA_KEYS, self.get_many(METADATA_KEYS)):
+            if value is not None:
+                ret[name] = value
+        return ret
 
     @property
     def byte_offset(self):
@@ -390,23 +485,37 @@ class GribField(object):
     def __del__(self):
         self._delete(self._handle)
 
+    def _get(self, name):
+        value = self._keys.get(name, None)
+        if value is None:
+            try:
+                value = grib_get(self._handle, name)
+            except Exception:
+                value = MISSING
+            self._keys[name] = value
+        return value
+
     def __getitem__(self, name):
-        try:
-            return grib_get(self._handle, name)
-        except Exception:
+        value = self._get(name)
+        if value is MISSING:
             raise KeyError(name)
+        return value
 
     def __getattr__(self, name):
-        try:
-            return grib_get(self._handle, name)
-        except Exception:
+        if name.startswith("_"):
             raise AttributeError(name)
+        value = self._get(name)
+        if value is MISSING:
+            raise AttributeError(name)
+        return value
 
     def get(self, name):
-        try:
-            return grib_get(self._handle, name)
-        except Exception:
-            return None
+        value = self._get(name)
+        return None if value is MISSING else value
+
+    def get_many(self, names) -> list:
+        """Returns the values of several keys (None for missing keys)."""
+        return [self.get(name) for name in names]
 
     def get_code(self, name):
         return grib_get_code(self._handle, name)
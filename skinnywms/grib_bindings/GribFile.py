@@ -14,13 +14,19 @@ from .GribField import GribField
 
 
 class GribFile(object):
-    def __init__(self, path):
+    """Iterates over the messages of a GRIB file.
+
+    :param headers_only: do not read the data sections of the messages, e.g.
+        when scanning the file. The values of the fields are then not available.
+    """
+
+    def __init__(self, path, headers_only=False):
 
         if path.startswith("~"):
             path = os.path.expanduser(path)
 
         self.path = path
-        self.file = grib_file_open(path)
+        self.file = grib_file_open(path, headers_only)
 
     def __del__(self):
         try:
@@ -202,6 +202,16 @@ grib_handle_new_from_file.argtypes = (grib_context_p, FILE_p, c_int_p)
 
 ####################################################################
 
+# Creates handles on the headers of the messages only: the data section is
+# skipped, which makes scanning large files much faster. Not exported by
+# older versions of ecCodes.
+grib_headers_only_new_from_file = getattr(dll, "grib_new_from_file", None)
+if grib_headers_only_new_from_file is not None:
+    grib_headers_only_new_from_file.restype = grib_handle_p
+    grib_headers_only_new_from_file.argtypes = (grib_context_p, FILE_p, c_int, c_int_p)
+
+####################################################################
+
 grib_handle_new_from_message_copy = dll.grib_handle_new_from_message_copy
 grib_handle_new_from_message_copy.restype = grib_handle_p
 grib_handle_new_from_message_copy.argtypes = (grib_context_p, c_void_p, c_size_t)
@@ -384,6 +394,12 @@ class GribError(Exception):
 grib_handle_new_from_file = partial(grib_handle_new_from_file, None)
 grib_handle_new_from_file = checked_error_in_last_paramater(grib_handle_new_from_file)
 
+if grib_headers_only_new_from_file is not None:
+    grib_headers_only_new_from_file = partial(grib_headers_only_new_from_file, None)
+    grib_headers_only_new_from_file = checked_error_in_last_paramater(
+        grib_headers_only_new_from_file
+    )
+
 ####################################################################
 grib_handle_new_from_message_copy = partial(grib_handle_new_from_message_copy, None)
 grib_handle_new_from_message_copy = checked_error_in_last_paramater(
@@ -453,10 +469,11 @@ fseek.restype = c_int
 
 
 class CFile(object):
-    def __init__(self, path):
+    def __init__(self, path, headers_only=False):
         self.f = fopen(path, "rb")
         if not self.f:
             raise Exception("Cannot open %s" % (path,))
+        self.headers_only = headers_only and grib_headers_only_new_from_file is not None
 
     def __del__(self):
         try:
@@ -476,6 +493,8 @@ class CFile(object):
         return fseek(self.f, position, whence)
 
     def next(self):
+        if self.headers_only:
+            return grib_headers_only_new_from_file(self.f, 1)
         return grib_handle_new_from_file(self.f)
 
 
@@ -495,8 +514,8 @@ class CFile2(object):
         return grib_handle_new_from_file(self.as_FILE(self.f))
 
 
-def grib_file_open(path):
-    return CFile(path)
+def grib_file_open(path, headers_only=False):
+    return CFile(path, headers_only)
 
 
 ####################################################################
@@ -510,25 +529,25 @@ def grib_values(handle, name="values"):
     return array
 
 
-def grib_get_metadata(
-    handle,
-    names: list = [
-        "centre",
-        "channel",
-        "level",
-        "levelist",
-        "levtype",
-        "long_name",
-        "originatingCentre",
-        "param",
-        "paramId",
-        "parameterUnits",
-        "shortName",
-        "standard_name",
-        "type",
-        "units",
-    ],
-):
+METADATA_KEYS = (
+    "centre",
+    "channel",
+    "level",
+    "levelist",
+    "levtype",
+    "long_name",
+    "originatingCentre",
+    "param",
+    "paramId",
+    "parameterUnits",
+    "shortName",
+    "standard_name",
+    "type",
+    "units",
+)
+
+
+def grib_get_metadata(handle, names: list = METADATA_KEYS):
     ret = {}
     for name in names:
         # TODO: the names list should be retrieved directly from magics, not hardcoded
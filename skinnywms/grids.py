@@ -0,0 +1,31 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+"""Geometry of the grids of GRIB fields, which does not require ecCodes."""
+
+import numpy as np
+
+__all__ = [
+    "reduced_grid",
+]
+
+
+def reduced_grid(pl_array, latitudes):
+    """Returns the latitudes and longitudes of the points of a reduced grid,
+    whose rows have `pl_array` points equally spaced from longitude 0."""
+    rows = min(len(pl_array), len(latitudes))
+    pl = np.asarray(pl_array[:rows], dtype=np.int64)
+    latitudes = np.asarray(latitudes[:rows], dtype=np.float64)
+
+    # index of each point in its row
+    starts = np.cumsum(pl) - pl
+    n = np.arange(pl.sum()) - np.repeat(starts, pl)
+
+    lats = np.repeat(latitudes, pl)
+    lons = (360.0 * n) / np.repeat(pl, pl)
+    return lats, lons
@@ -82,6 +82,9 @@ except Exception as e:
 
 
 class StaticLayer(datatypes.Layer):
+
+    static = True
+
     def style(self, name):
         return None
 
@@ -253,8 +256,10 @@ class Plotter(datatypes.Plotter):
         driver=macro,
         dark_mode=False,
         omit_default_layers=False,
+        render_pool=None,
     ):
         self.driver = driver
+        self.render_pool = render_pool
         self.dark_mode = dark_mode
         self.legend_text_colour = "white" if dark_mode else "charcoal"
 
@@ -427,40 +432,60 @@ class Plotter(datatypes.Plotter):
         output_fname = output.target(magics_format)
         path, _ = os.path.splitext(output_fname)
 
-        with LOCK:
-
-            self.driver.silent()
+        args = [
+            self.output(
+                formats=magics_format,
+                transparent=transparent,
+                width=width,
+                path=path,
+            ),
+            self.mmap(
+                bbox=bbox,
+                width=width,
+                height=height,
+                crs_name=crs_name,
+                lon_vertical=lon_vertical,
+            ),
+        ]
 
-            args = [
-                self.output(
-                    formats=magics_format,
-                    transparent=transparent,
-                    width=width,
-                    path=path,
-                ),
-                self.mmap(
-                    bbox=bbox,
-                    width=width,
-                    height=height,
-                    crs_name=crs_name,
-                    lon_vertical=lon_vertical,
+        args += self.mlayers(context, layers, styles)
+
+        if _macro:
+            return (
+                "text/x-python",
+                self.macro_text(
+                    args,
+                    output.target(".py"),
+                    getattr(context, "data_url", None),
+                    layers,
+                    styles,
                 ),
-            ]
-
-            args += self.mlayers(context, layers, styles)
-
-            if _macro:
-                return (
-                    "text/x-python",
-                    self.macro_text(
-                        args,
-                        output.target(".py"),
-                        getattr(context, "data_url", None),
-                        layers,
-                        styles,
-                    ),
-                )
+            )
+
+        self.render(args)
 
+        self.log.debug(
+            "plot(): Size of %s: %s", output_fname, os.stat(output_fname).st_size
+        )
+
+        return format, output_fname
+
+    def render(self, args):
+        """Run Magics on the list of actions `args`, either in a worker of the
+        render pool or in this process, under the global lock.
+        """
+        if self.render_pool is not None:
+            try:
+                self.render_pool.plot(args)
+            except errors.WMSError:
+                raise
+            except Exception as e:
+                self.log.exception("Magics error: %s", e)
+                raise
+            return
+
+        with LOCK:
+            self.driver.silent()
             # self.log.debug('plot(): Calling self.driver.plot(%s)', args)
             try:
                 self.driver.plot(*args)
@@ -468,12 +493,6 @@ class Plotter(datatypes.Plotter):
                 self.log.exception("Magics error: %s", e)
                 raise
 
-            self.log.debug(
-                "plot(): Size of %s: %s", output_fname, os.stat(output_fname).st_size
-            )
-
-            return format, output_fname
-
     def legend(
         self,
         context,
@@ -496,84 +515,77 @@ class Plotter(datatypes.Plotter):
         output_fname = output.target(magics_format)
         path, _ = os.path.splitext(output_fname)
 
-        with LOCK:
-
-            # Magics is talking in cm.
-            width_cm = float(width) / 40.0
-            height_cm = float(height) / 40.0
-
-            args = [
-                self.driver.output(
-                    output_formats=[magics_format],
-                    output_name_first_page_number="off",
-                    output_cairo_transparent_background=transparent,
-                    output_width=width,
-                    output_name=path,
-                ),
-                self.driver.mmap(
-                    subpage_frame="off",
-                    page_x_length=width_cm,
-                    page_y_length=height_cm,
-                    super_page_x_length=width_cm,
-                    super_page_y_length=height_cm,
-                    subpage_x_length=width_cm,
-                    subpage_y_length=height_cm,
-                    subpage_x_position=0.0,
-                    subpage_y_position=0.0,
-                    subpage_gutter_percentage=20.0,
-                    output_width=width,
-                    page_frame="off",
-                    page_id_line="off",
-                ),
-            ]
+        # Magics is talking in cm.
+        width_cm = float(width) / 40.0
+        height_cm = float(height) / 40.0
+
+        args = [
+            self.driver.output(
+                output_formats=[magics_format],
+                output_name_first_page_number="off",
+                output_cairo_transparent_background=transparent,
+                output_width=width,
+                output_name=path,
+            ),
+            self.driver.mmap(
+                subpage_frame="off",
+                page_x_length=width_cm,
+                page_y_length=height_cm,
+                super_page_x_length=width_cm,
+                super_page_y_length=height_cm,
+                subpage_x_length=width_cm,
+                subpage_y_length=height_cm,
+                subpage_x_position=0.0,
+                subpage_y_position=0.0,
+                subpage_gutter_percentage=20.0,
+                output_width=width,
+                page_frame="off",
+                page_id_line="off",
+            ),
+        ]
 
-            contour = layer.style(
-                style,
-            )
+        contour = layer.style(
+            style,
+        )
 
-            args += layer.render(
-                context,
-                self.driver,
-                contour,
-                {"legend": "on", "contour_legend_only": True},
-            )
+        args += layer.render(
+            context,
+            self.driver,
+            contour,
+            {"legend": "on", "contour_legend_only": True},
+        )
 
-            legend_font_size = "25%"
-            if width_cm < height_cm:
-                legend_font_size = "5%"
-
-            legend_title = layer.title
-            if hasattr(layer, legend_title):
-                legend_title = layer.legend_title
-
-            legend = self.driver.mlegend(
-                legend_title="on",
-                legend_title_text=legend_title,
-                legend_display_type="continuous",
-                legend_box_mode="positional",
-                legend_only=True,
-                legend_box_x_position=0.00,
-                legend_box_y_position=0.00,
-                legend_box_x_length=width_cm,
-                legend_box_y_length=height_cm,
-                legend_box_blanking=not transparent,
-                legend_text_font_size=legend_font_size,
-                legend_text_colour=self.legend_text_colour,  # will be white in dark mode
-                legend_title_position_ratio=legend_title_position_ratio,
-            )
+        legend_font_size = "25%"
+        if width_cm < height_cm:
+            legend_font_size = "5%"
+
+        legend_title = layer.title
+        if hasattr(layer, legend_title):
+            legend_title = layer.legend_title
+
+        legend = self.driver.mlegend(
+            legend_title="on",
+            legend_title_text=legend_title,
+            legend_display_type="continuous",
+            legend_box_mode="positional",
+            legend_only=True,
+            legend_box_x_position=0.00,
+            legend_box_y_position=0.00,
+            legend_box_x_length=width_cm,
+            legend_box_y_length=height_cm,
+            legend_box_blanking=not transparent,
+            legend_text_font_size=legend_font_size,
+            legend_text_colour=self.legend_text_colour,  # will be white in dark mode
+            legend_title_position_ratio=legend_title_position_ratio,
+        )
 
-            # self.log.debug('plot(): Calling self.driver.plot(%s)', args)
-            try:
-                self.driver.plot(*args, legend)
-            except Exception as e:
-                self.log.exception("Magics error: %s", e)
-                raise
+        self.render(args + [legend])
 
-            self.log.debug(
-                "plot(): Size of %s: %s", output_fname, os.stat(output_fname).st_size
-            )
+        self.log.debug(
+            "plot(): Size of %s: %s", output_fname, os.stat(output_fname).st_size
+        )
 
-            return output_fname
+        return output_fname
 
     def macro_text(self, args, output, data_url, layers, styles):
         head = []
@@ -627,6 +639,19 @@ class Styler(datatypes.Styler):
             except:
                 self.user_style = None
 
+    def __getstate__(self):
+        # stylers are sent to the processes scanning files in parallel,
+        # where Magics is imported again
+        state = self.__dict__.copy()
+        state.pop("_context", None)
+        if state.get("driver") is macro:
+            del state["driver"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("driver", macro)
+
     def netcdf_styles(self, field, ncvar, path, variable):
         if self.user_style:
             return [MagicsWebStyle(self.user_style["name"])]
@@ -0,0 +1,226 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+
+from skinnywms import errors
+
+__all__ = [
+    "RenderPool",
+]
+
+LOG = logging.getLogger(__name__)
+
+# Workers are (re)started from a multithreaded server: forking it could copy a
+# lock held by another thread (e.g. of the logging module) into the child,
+# which would then deadlock
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def _worker_main(conn, render=None):
+    """Main loop of a render worker. Each worker owns its own Magics instance,
+    so there is no need for a lock around the calls to `macro.plot`.
+    """
+    if render is None:
+        from Magics import macro
+
+        macro.silent()
+
+        def render(job):
+            macro.plot(*[getattr(macro, verb)(**args) for verb, args in job])
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if job is None:
+            break
+
+        try:
+            render(job)
+            conn.send((True, None))
+        except Exception as e:
+            conn.send((False, "%s: %s" % (e.__class__.__name__, e)))
+
+    conn.close()
+
+
+class RenderWorker:
+    """A long-lived child process rendering Magics plots."""
+
+    def __init__(self, mp_context, name, render=None):
+        self._mp_context = mp_context
+        self._render = render
+        self.name = name
+        self.process = None
+        self.conn = None
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = self._mp_context.Pipe()
+        self.process = self._mp_context.Process(
+            target=_worker_main,
+            args=(child_conn, self._render),
+            name=self.name,
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        LOG.info("Started render worker %s (pid=%s)", self.name, self.process.pid)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+    def restart(self):
+        LOG.warning("Restarting render worker %s", self.name)
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.start()
+
+    def run(self, job, timeout):
+        try:
+            self.conn.send(job)
+            if not self.conn.poll(timeout):
+                self.restart()
+                raise TimeoutError(
+                    "Render worker %s timed out after %ss" % (self.name, timeout)
+                )
+            ok, result = self.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError) as e:
+            self.restart()
+            raise RuntimeError("Render worker %s died: %s" % (self.name, e))
+
+        if not ok:
+            raise RuntimeError("Magics error in worker %s: %s" % (self.name, result))
+
+        return result
+
+
+class RenderPool:
+    """A pool of render worker processes, each one with its own Magics instance.
+
+    :param workers: number of worker processes (defaults to the number of CPUs)
+    :param queue_size: maximum number of requests waiting for a free worker
+    :param timeout: maximum number of seconds a single plot may take
+    :param queue_timeout: maximum number of seconds to wait for a free worker
+    :param start_method: multiprocessing start method ('forkserver', or
+        'spawn' where it is not available, by default)
+    :param render: function rendering the jobs in the workers (Magics by
+        default), which must be picklable
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        queue_size: int = None,
+        timeout: float = 60.0,
+        queue_timeout: float = 30.0,
+        start_method: str = None,
+        render=None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = self.workers * 4 if queue_size is None else queue_size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.start_method = start_method or START_METHOD
+        self.render = render
+
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._idle = queue.Queue()
+        self._pool = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._pool:
+                return
+            mp_context = multiprocessing.get_context(self.start_method)
+            for i in range(self.workers):
+                worker = RenderWorker(
+                    mp_context, "skinnywms-render-%d" % (i,), self.render
+                )
+                self._pool.append(worker)
+                self._idle.put(worker)
+
+    def plot(self, args):
+        """Render the list of Magics actions `args` in a free worker.
+        The actions are sent as (verb, parameters) pairs, the output is written
+        by the worker to the `output_name` given in the actions.
+        """
+        if not self._pool:
+            self._start()
+
+        job = [(a.verb, dict(a.args)) for a in args]
+
+        if not self._slots.acquire(blocking=False):
+            raise errors.ServiceUnavailable(
+                "Render queue is full (%d requests)" % (self.workers + self.queue_size,)
+            )
+        try:
+            try:
+                worker = self._idle.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                raise errors.ServiceUnavailable(
+                    "No render worker available after %ss" % (self.queue_timeout,)
+                )
+            try:
+                return worker.run(job, self.timeout)
+            finally:
+                self._release(worker)
+        finally:
+            self._slots.release()
+
+    def _release(self, worker):
+        with self._lock:
+            if any(w is worker for w in self._pool):
+                self._idle.put(worker)
+                return
+        # the pool has been shut down during the render
+        worker.stop()
+
+    def stats(self) -> dict:
+        return dict(
+            workers=self.workers,
+            queue_size=self.queue_size,
+            started=len(self._pool),
+            idle=self._idle.qsize(),
+        )
+
+    def shutdown(self):
+        """Stops the idle workers, and the busy ones once their render is done."""
+        with self._lock:
+            self._pool = []
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                worker.stop()
+
+    def __repr__(self):
+        return "RenderPool[workers=%s,queue_size=%s,timeout=%s]" % (
+            self.workers,
+            self.queue_size,
+            self.timeout,
+        )
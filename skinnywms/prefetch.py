@@ -0,0 +1,230 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+import bisect
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = [
+    "Prefetcher",
+]
+
+LOG = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def _parse_time(time):
+    try:
+        return datetime.datetime.strptime(str(time)[:19], TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+class Prefetcher:
+    """Renders in the background the next time steps of maps that are
+    requested one time step after the other, e.g. by an animation, so that
+    they are already cached when the client requests them.
+
+    A sequence is a layer (or list of layers) requested with the same bounding
+    box, size, style etc.: when two consecutive requests of a sequence are
+    for consecutive times of the layer, forwards or backwards, the next
+    `depth` times in that direction are rendered.
+
+    Prefetching backs off when the server is busy: a map is not prefetched
+    while other maps are being rendered for clients, while all the render
+    workers are busy, or while the load average per CPU is above `max_load`,
+    and it is given up if the server stays busy for `patience` seconds.
+
+    :param server: the WMS server rendering the maps
+    :param depth: number of time steps rendered ahead
+    :param workers: number of maps prefetched at the same time
+    :param max_load: load average per CPU above which nothing is prefetched,
+        or None to ignore the load of the machine
+    :param max_pending: maximum number of maps waiting to be prefetched
+    :param patience: number of seconds a map waits for the server to be
+        less busy before it is given up
+    :param history: number of sequences remembered
+    """
+
+    def __init__(
+        self,
+        server,
+        depth: int = 2,
+        workers: int = 1,
+        max_load: float = None,
+        max_pending: int = 64,
+        patience: float = 10.0,
+        history: int = 1024,
+    ):
+        self.server = server
+        self.depth = depth
+        self.workers = workers
+        self.max_load = max_load
+        self.max_pending = max_pending
+        self.patience = patience
+        self.history = history
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="skinnywms-prefetch"
+        )
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # last time requested, by sequence
+        self._last = OrderedDict()
+        self._pending = set()
+        self._running = 0
+        # (generation, naive times, times) by layer name
+        self._times = {}
+
+        self.scheduled = 0
+        self.prefetched = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def observe(self, layers: list, when, request: dict) -> None:
+        """Notes that the map of `layers` at time `when` is requested with the
+        other parameters of `get_map` in `request`, and prefetches the next
+        time steps if the previous request of the same sequence was for the
+        previous time step."""
+        if getattr(self._local, "prefetching", False):
+            return
+
+        when = _parse_time(when)
+        if when is None:
+            return
+
+        naive, times = self._layer_times(layers)
+        i = bisect.bisect_left(naive, when)
+        if i == len(naive) or naive[i] != when:
+            return
+
+        sequence = json.dumps([layers, request], sort_keys=True, default=str)
+        with self._lock:
+            previous = self._last.pop(sequence, None)
+            self._last[sequence] = when
+            while len(self._last) > self.history:
+                self._last.popitem(last=False)
+
+        if previous is None:
+            return
+        if i > 0 and naive[i - 1] == previous:
+            step = 1
+        elif i + 1 < len(naive) and naive[i + 1] == previous:
+            step = -1
+        else:
+            return
+
+        for n in range(1, self.depth + 1):
+            j = i + n * step
+            if j < 0 or j >= len(times):
+                break
+            self._schedule(sequence, layers, times[j], request)
+
+    def _layer_times(self, layers: list):
+        availability = self.server.availability
+        generation = availability.generation
+        for name in layers:
+            cached = self._times.get(name)
+            if cached is None or cached[0] != generation:
+                times = availability.available_times(name)
+                naive = [t.replace(tzinfo=None) for t in times]
+                cached = self._times[name] = (generation, naive, times)
+            if cached[1]:
+                return cached[1], cached[2]
+        return [], []
+
+    def _schedule(self, sequence, layers, when, request):
+        pending = (sequence, when)
+        with self._lock:
+            if pending in self._pending:
+                return
+            if len(self._pending) >= self.max_pending:
+                self.skipped += 1
+                return
+            self._pending.add(pending)
+            self.scheduled += 1
+
+        self._executor.submit(self._prefetch, pending, layers, when, request)
+
+    def _prefetch(self, pending, layers, when, request):
+        try:
+            # wait for the renders requested by clients, e.g. the current
+            # frame of an animation
+            deadline = time.monotonic() + self.patience
+            while self.busy():
+                if time.monotonic() > deadline:
+                    with self._lock:
+                        self.skipped += 1
+                    return
+                time.sleep(0.1)
+
+            with self._lock:
+                self._running += 1
+            self._local.prefetching = True
+            output = self.server.caching.create_output()
+            try:
+                self.server.get_map(
+                    output,
+                    layers=layers,
+                    time=when.strftime(TIME_FORMAT + "Z"),
+                    **request,
+                )
+                with self._lock:
+                    self.prefetched += 1
+            finally:
+                output.cleanup()
+                self._local.prefetching = False
+                with self._lock:
+                    self._running -= 1
+        except Exception as e:
+            LOG.warning("Cannot prefetch %s at %s: %s", layers, when, e)
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self._pending.discard(pending)
+
+    def busy(self) -> bool:
+        """Returns True if the server is too busy to prefetch maps."""
+        # renders in flight, other than the ones of the prefetcher
+        if self.server.coalescing.stats()["in_flight"] > self._running:
+            return True
+
+        render_pool = getattr(self.server.plotter, "render_pool", None)
+        if render_pool is not None:
+            stats = render_pool.stats()
+            if stats["started"] and not stats["idle"]:
+                return True
+
+        if self.max_load is not None:
+            try:
+                load = os.getloadavg()[0] / (os.cpu_count() or 1)
+            except OSError:  # not available on all platforms
+                return False
+            if load > self.max_load:
+                return True
+
+        return False
+
+    def stats(self) -> dict:
+        return dict(
+            depth=self.depth,
+            workers=self.workers,
+            pending=len(self._pending),
+            scheduled=self.scheduled,
+            prefetched=self.prefetched,
+            skipped=self.skipped,
+            failed=self.failed,
+        )
@@ -6,16 +6,25 @@
 # granted to it by virtue of its status as an intergovernmental organisation nor
 # does it submit to any jurisdiction.
 
+from __future__ import annotations
+
 from typing import TYPE_CHECKING  # see PEP 563, python 3.7+
 
 if TYPE_CHECKING:
     from skinnywms.datatypes import Availability, Plotter, Styler
 
+import email.utils
+import hashlib
+import html
+import json
 import logging
 import os
 import tempfile
+import threading
+import time
 
-from skinnywms import errors, protocol
+from skinnywms import errors, protocol, tiles
+from skinnywms.coalescing import SingleFlight
 
 LOG = logging.getLogger(__name__)
 
@@ -27,6 +36,127 @@ def revert_bbox(bbox):
 
 bounding_box = {"1.3.0_EPSG:4326": revert_bbox}
 
+# A RAM-backed file system (tmpfs), if available, where Magics can write plots
+# that are immediately read back into memory
+SHM_DIRECTORY = "/dev/shm"
+
+
+def layer_identity(layer) -> list:
+    """Returns what identifies the data rendered by a layer: the type of the
+    layer, its representation (which contains the field location, e.g. its
+    byte offset or its slices) and, for fields read from a file, the path,
+    size and modification time of that file.
+    """
+    identity = [layer.__class__.__name__, repr(layer)]
+    path = getattr(layer, "path", None)
+    if path:
+        try:
+            st = os.stat(path)
+            identity += [path, st.st_size, st.st_mtime_ns]
+        except OSError:
+            identity.append(path)
+    return identity
+
+
+def request_key(request: str, params: dict, layers: list) -> str:
+    """Builds a key that identifies the response to a request, from its
+    normalised WMS parameters and the identity of the layers it renders.
+    """
+    text = json.dumps(
+        dict(
+            request=request,
+            params=params,
+            layers=[layer_identity(layer) for layer in layers],
+        ),
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class NotModified(Exception):
+    """Raised to answer a conditional request without rendering."""
+
+    pass
+
+
+def cache_headers(etag: str, max_age: int = 0) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": (
+            "public, max-age=%d" % (max_age,) if max_age > 0 else "no-cache"
+        ),
+    }
+
+
+def make_etag(content) -> str:
+    if isinstance(content, str):
+        content = content.encode()
+    return '"%s"' % (hashlib.sha1(content).hexdigest(),)
+
+
+def not_modified(request, etag: str, last_modified: float = None) -> bool:
+    """Checks the validators of a conditional request (RFC 7232): returns True
+    if the client already has the version of the resource identified by `etag`
+    or last modified at `last_modified`.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since.timestamp()
+
+    return False
+
+
+# The URL of the service in the capabilities documents, which are rendered
+# once for all the clients, and replaced with the URL requested by each of them
+SERVICE_URL = "skinnywms-service-url"
+
+
+class Capabilities:
+    """A rendered GetCapabilities document, and its validators."""
+
+    def __init__(self, generation: int, content_type: str, content: str):
+        self.generation = generation
+        self.content_type = content_type
+        self.content = content
+        self.etag = make_etag(content)
+        self.last_modified = time.time()
+
+    def with_service_url(self, service_url: str) -> Capabilities:
+        """Returns the document with the URL of the service requested by a
+        client (see SERVICE_URL)."""
+        capabilities = Capabilities(
+            self.generation,
+            self.content_type,
+            self.content.replace(SERVICE_URL, html.escape(service_url)),
+        )
+        capabilities.last_modified = self.last_modified
+        return capabilities
+
+    def headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": email.utils.formatdate(self.last_modified, usegmt=True),
+            # let clients use their copy as long as it is still valid
+            "Cache-Control": "no-cache",
+        }
+
 
 class TmpFile:
     def __init__(self):
@@ -46,18 +176,68 @@ class TmpFile:
 
     def content(self):
         with open(self.fname, "rb") as f:
-            c = f.read()
-            os.close(f)
-        return c
+            return f.read()
 
     def cleanup(self):
+        if self.fname is None:
+            return
         LOG.debug("Deleting %s" % self.fname)
         os.unlink(self.fname)
 
 
+class MemoryFile(TmpFile):
+    """Renders into a RAM-backed file system and hands over the content of the
+    plot as bytes. The file is removed as soon as its content has been read.
+    """
+
+    def __init__(self, directory=None):
+        super(MemoryFile, self).__init__()
+        if directory is None and os.access(SHM_DIRECTORY, os.W_OK):
+            directory = SHM_DIRECTORY
+        self.directory = directory
+
+    def target(self, ext):
+        self.cleanup()
+        fd, self.fname = tempfile.mkstemp(
+            prefix="wms-server-", suffix=".{}".format(ext), dir=self.directory
+        )
+        os.close(fd)
+        return self.fname
+
+    def content(self):
+        try:
+            return super(MemoryFile, self).content()
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        if self.fname is None:
+            return
+        try:
+            os.unlink(self.fname)
+        except FileNotFoundError:
+            pass
+        self.fname = None
+
+
 class NoCaching:
+
+    enabled = False
+
     def create_output(self):
-        return TmpFile()
+        return MemoryFile()
+
+    def key(self, request, params, layers):
+        return request_key(request, params, layers)
+
+    def get(self, key):
+        return None
+
+    def put(self, key, content):
+        pass
+
+    def stats(self):
+        return {}
 
 
 class WMSServer:
@@ -67,6 +247,17 @@ class WMSServer:
         plotter: Plotter,
         styler: Styler,
         caching=NoCaching(),
+        max_age: int = 0,
+        layer_max_age: dict = None,
+        legend_caching=NoCaching(),
+        static_caching=NoCaching(),
+        composite_layers: bool = False,
+        metatile: int = 1,
+        metatile_buffer: int = 64,
+        prefetch_depth: int = 0,
+        prefetch_workers: int = 1,
+        prefetch_max_load: float = None,
+        grid_cache=None,
     ):
 
         self.availability = availability
@@ -79,10 +270,61 @@ class WMSServer:
         self.styler.set_context(self)
 
         self.caching = caching
+        self.legend_caching = legend_caching
+        # Tiles of the layers that do not depend on data (e.g. coastlines),
+        # rendered once per cell of a tile grid
+        self.static_caching = static_caching
+
+        # Renders in flight, shared by identical concurrent requests
+        self.coalescing = SingleFlight()
+
+        # Render blocks of metatile x metatile tiles at once, and cache them.
+        # Blocks are rendered with a margin of metatile_buffer pixels, so that
+        # contours, labels and symbols match on both sides of their edges
+        self.metatile = metatile
+        self.metatile_buffer = metatile_buffer
+
+        # Render the layers of a map separately, so that each of them is
+        # cached, and composite them
+        self.composite_layers = composite_layers
+        if composite_layers:
+            from skinnywms import compositing
+
+            if not compositing.available("image/png"):
+                LOG.warning("Pillow is not installed, layers cannot be composited")
+                self.composite_layers = False
+
+        # Render the next time steps of animated maps in the background, so
+        # that they are cached when requested
+        self.prefetcher = None
+        if prefetch_depth > 0:
+            if caching.enabled:
+                from skinnywms.prefetch import Prefetcher
+
+                self.prefetcher = Prefetcher(
+                    self,
+                    depth=prefetch_depth,
+                    workers=prefetch_workers,
+                    max_load=prefetch_max_load,
+                )
+            else:
+                LOG.warning("Maps are not cached, time steps cannot be prefetched")
+
+        # Number of seconds clients may reuse maps and legends (Cache-Control),
+        # by default and for specific layers
+        self.max_age = max_age
+        self.layer_max_age = layer_max_age or {}
 
         # For objects to store context
         self.stash = {}
 
+        # The cache of the coordinates of GRIB grids, reported in the metrics
+        self.grid_cache = grid_cache
+
+        # Rendered capabilities documents, by version
+        self._capabilities = {}
+        self._capabilities_lock = threading.Lock()
+
     def process(
         self, request, Response, send_file, render_template, reraise=False, output=None
     ):
@@ -113,8 +355,17 @@ class WMSServer:
                 raise Exception("Unsupported WMS version {}".format(version))
 
             if req == "getcapabilities":
-                content_type, content = self.get_capabilities(
-                    version, url, render_template
+                capabilities = self.capabilities(version, url, render_template)
+                headers = capabilities.headers()
+                if not_modified(
+                    request, capabilities.etag, capabilities.last_modified
+                ):
+                    return Response(status=304, headers=headers)
+
+                return Response(
+                    capabilities.content,
+                    mimetype=capabilities.content_type,
+                    headers=headers,
                 )
             elif req == "getmap":
                 params = protocol.get_wms_parameters(req, version, params)
@@ -130,11 +381,17 @@ class WMSServer:
                     srs = params.pop("srs")
                     params["crs"] = srs
 
-                content_type, path = self.get_map(**params)
-                resp = send_file(path, content_type)
-                output.cleanup()
+                headers = {}
+                try:
+                    content_type, content = self.get_map(
+                        validate=self.validator(request, headers), **params
+                    )
+                except NotModified:
+                    return Response(status=304, headers=headers)
+                finally:
+                    output.cleanup()
 
-                return resp
+                return Response(content, mimetype=content_type, headers=headers)
 
             elif req == "getlegendgraphic":
                 params = protocol.get_wms_parameters(req, version, params)
@@ -147,11 +404,17 @@ class WMSServer:
                     except KeyError:
                         pass
 
-                content_type, path = self.get_legend(**params)
-                resp = send_file(path, content_type)
-                output.cleanup()
+                headers = {}
+                try:
+                    content_type, content = self.get_legend(
+                        validate=self.validator(request, headers), **params
+                    )
+                except NotModified:
+                    return Response(status=304, headers=headers)
+                finally:
+                    output.cleanup()
 
-                return resp
+                return Response(content, mimetype=content_type, headers=headers)
 
             else:
                 raise errors.OperationNotSupported(req_orig)
@@ -161,6 +424,7 @@ class WMSServer:
             LOG.exception("%s(): Error: %s", req, exc)
             content_type = exc.content_type(version)
             content = exc.body(version)
+            status = exc.status
 
         except Exception as exc:
             if reraise:
@@ -170,8 +434,33 @@ class WMSServer:
             exc = errors.wrap(exc)
             content_type = exc.content_type(version)
             content = exc.body(version)
-
-        return Response(content, mimetype=content_type)
+            status = exc.status
+
+        return Response(content, mimetype=content_type, status=status)
+
+    def validator(self, request, headers: dict):
+        """Returns a function that sets the validation headers of the response
+        to a request, and raises NotModified if the client already has it.
+        """
+
+        def validate(key, layers):
+            etag = '"%s"' % (key,)
+            headers.update(cache_headers(etag, self.layers_max_age(layers)))
+            if not_modified(request, etag):
+                raise NotModified()
+
+        return validate
+
+    def layers_max_age(self, layers) -> int:
+        """Returns the max-age of a map or legend of the requested `layers`,
+        the one of the layer that changes the most often."""
+        return min(
+            (
+                self.layer_max_age.get(self.availability.resolve(name), self.max_age)
+                for name in layers
+            ),
+            default=self.max_age,
+        )
 
     def get_map(
         self,
@@ -191,6 +480,7 @@ class WMSServer:
         exceptions=None,
         time=None,
         transparent=True,
+        validate=None,
     ):
 
         if not styles:
@@ -213,30 +503,150 @@ class WMSServer:
 
         # Interpret the BBox
 
-        bbox = bounding_box.get("{}_{}".format(version, crs), (lambda x: x))(bbox)
-
-        LOG.debug("->{}_{}".format(version, crs))
-
-        mime_type, path = self.plotter.plot(
-            self,
-            output,
-            bbox,
-            crs,
-            format,
-            height,
-            layer_objs,
-            styles,
-            version,
-            width,
-            _macro=_macro,
-            bgcolor=bgcolor,
-            elevation=elevation,
-            exceptions=exceptions,
-            time=time,
-            transparent=transparent,
-        )
+        xy_bbox = bounding_box.get("{}_{}".format(version, crs), (lambda x: x))(bbox)
+
+        key = None
+        tile = None
+        caching = self.caching
+        if not _macro:
+            params = dict(
+                bbox=bbox,
+                crs=crs,
+                format=format,
+                height=height,
+                width=width,
+                version=version,
+                styles=styles,
+                bgcolor=bgcolor,
+                transparent=transparent,
+            )
+
+            # maps that match a tile are cached by tile, whatever the version
+            # of the protocol or the rounding of the bounding box, and those
+            # of static layers separately
+            tile = tiles.locate(crs, xy_bbox)
+            if tile is not None:
+                grid, zoom, x, y = tile
+                del params["bbox"], params["version"]
+                params["tile"] = (grid.name, zoom, x, y)
+                if self.static_caching.enabled and all(
+                    layer.static for layer in layer_objs
+                ):
+                    caching = self.static_caching
+
+            key = caching.key("getmap", params, layer_objs)
+            if key is not None and time is not None and self.prefetcher is not None:
+                self.prefetcher.observe(
+                    layers,
+                    time,
+                    dict(
+                        bbox=bbox,
+                        crs=crs,
+                        format=format,
+                        height=height,
+                        version=version,
+                        width=width,
+                        styles=styles,
+                        bgcolor=bgcolor,
+                        dim_index=dim_index,
+                        elevation=elevation,
+                        exceptions=exceptions,
+                        transparent=transparent,
+                    ),
+                )
 
-        return mime_type, path
+            if key is not None:
+                if validate is not None:
+                    validate(key, layers)
+                content = caching.get(key)
+                if content is not None:
+                    return format, content
+
+        def render():
+            if self.composite_layers and len(layer_objs) > 1 and not _macro:
+                from skinnywms import compositing
+
+                # other formats are rendered by Magics in one go
+                if compositing.available(format):
+                    content = self.composite(
+                        output,
+                        bbox,
+                        crs,
+                        format,
+                        height,
+                        layers,
+                        layer_objs,
+                        version,
+                        width,
+                        styles,
+                        bgcolor=bgcolor,
+                        dim_index=dim_index,
+                        elevation=elevation,
+                        exceptions=exceptions,
+                        time=time,
+                        transparent=transparent,
+                    )
+                    if key is not None:
+                        caching.put(key, content)
+                    return format, content
+
+            if self.metatile > 1 and tile is not None and caching.enabled:
+                from skinnywms import compositing
+
+                if compositing.available(format):
+                    content = self.render_metatile(
+                        output,
+                        tile,
+                        caching,
+                        params,
+                        crs,
+                        format,
+                        height,
+                        layer_objs,
+                        styles,
+                        version,
+                        width,
+                        bgcolor=bgcolor,
+                        elevation=elevation,
+                        exceptions=exceptions,
+                        time=time,
+                        transparent=transparent,
+                    )
+                    return format, content
+
+            LOG.debug("->{}_{}".format(version, crs))
+
+            mime_type, path = self.plotter.plot(
+                self,
+                output,
+                xy_bbox,
+                crs,
+                format,
+                height,
+                layer_objs,
+                styles,
+                version,
+                width,
+                _macro=_macro,
+                bgcolor=bgcolor,
+                elevation=elevation,
+                exceptions=exceptions,
+                time=time,
+                transparent=transparent,
+            )
+
+            content = output.content()
+            if key is not None:
+                caching.put(key, content)
+
+            return mime_type, content
+
+        if key is None:
+            return render()
+
+        # identical requests that arrive while the map is being rendered
+        # wait for it, rather than rendering it again
+        return self.coalescing.do(key, render)
 
     def get_legend(
         self,
@@ -250,6 +660,7 @@ class WMSServer:
         exceptions=None,
         transparent=True,
         legend_title_position_ratio=50.0,
+        validate=None,
     ):
 
         time = None
@@ -257,9 +668,35 @@ class WMSServer:
         try:
             legend = self.availability.layer(layer, time)
         except errors.LayerNotDefined:
-            legend = self.plotter.layer
-
-        path = self.plotter.legend(
+            legend = self.plotter.layer(layer)
+
+        # the default style is the first one
+        styles = getattr(legend, "styles", None)
+        if not style and styles:
+            style = styles[0].name
+
+        key = self.legend_caching.key(
+            "getlegendgraphic",
+            dict(
+                format=format,
+                style=style,
+                height=height,
+                width=width,
+                version=version,
+                transparent=transparent,
+                legend_title_position_ratio=legend_title_position_ratio,
+                dark_mode=getattr(self.plotter, "dark_mode", False),
+            ),
+            [legend],
+        )
+        if key is not None:
+            if validate is not None:
+                validate(key, [layer])
+            content = self.legend_caching.get(key)
+            if content is not None:
+                return format, content
+
+        self.plotter.legend(
             self,
             output,
             format,
@@ -272,7 +709,290 @@ class WMSServer:
             legend_title_position_ratio,
         )
 
-        return format, path
+        content = output.content()
+        if key is not None:
+            self.legend_caching.put(key, content)
+
+        return format, content
+
+    def composite(
+        self,
+        output,
+        bbox,
+        crs,
+        format,
+        height,
+        layers,
+        layer_objs,
+        version,
+        width,
+        styles,
+        bgcolor=None,
+        transparent=True,
+        **dims,
+    ) -> bytes:
+        """Renders each layer of a map as a transparent image (which is cached
+        like any map) and composites them in zindex order.
+        """
+        from skinnywms import compositing
+
+        if not compositing.available(format):
+            raise errors.InvalidFormat(format)
+
+        # the fields selected in data layers have no zindex, like their
+        # layers (see DataLayer)
+        order = sorted(
+            range(len(layers)), key=lambda i: getattr(layer_objs[i], "zindex", 0)
+        )
+
+        images = []
+        for i in order:
+            _, content = self.get_map(
+                output,
+                bbox,
+                crs,
+                format,
+                height,
+                [layers[i]],
+                version,
+                width,
+                styles=[styles[i]],
+                transparent=True,
+                **dims,
+            )
+            images.append(content)
+
+        return compositing.composite(images, format, transparent, bgcolor)
+
+    def render_metatile(
+        self,
+        output,
+        tile,
+        caching,
+        params,
+        crs,
+        format,
+        height,
+        layer_objs,
+        styles,
+        version,
+        width,
+        transparent=True,
+        **kwargs,
+    ) -> bytes:
+        """Renders the block of metatile x metatile tiles that contains `tile` in
+        one go, with a margin of `metatile_buffer` pixels that is cropped, caches
+        all the tiles of the block, and returns the content of `tile`.
+        """
+        from skinnywms import compositing
+
+        grid, zoom, x, y = tile
+        columns, rows = grid.size(zoom)
+
+        x0, y0 = x - x % self.metatile, y - y % self.metatile
+        block_columns = min(self.metatile, columns - x0)
+        block_rows = min(self.metatile, rows - y0)
+
+        # the margins around the block, in pixels, within the extent of the grid
+        buffer = self.metatile_buffer
+        margins = (
+            min(buffer, x0 * width),
+            min(buffer, y0 * height),
+            min(buffer, (columns - x0 - block_columns) * width),
+            min(buffer, (rows - y0 - block_rows) * height),
+        )
+
+        def render():
+            min_x, min_y, _, _ = grid.bbox(zoom, x0, y0 + block_rows - 1)
+            _, _, max_x, max_y = grid.bbox(zoom, x0 + block_columns - 1, y0)
+
+            dx, dy = grid.span(zoom)
+            dx, dy = dx / width, dy / height
+            left, top, right, bottom = margins
+            bbox = (
+                min_x - left * dx,
+                min_y - bottom * dy,
+                max_x + right * dx,
+                max_y + top * dy,
+            )
+
+            LOG.debug(
+                "Rendering metatile %sx%s at %s/%s/%s of %s",
+                block_columns,
+                block_rows,
+                zoom,
+                x0,
+                y0,
+                grid,
+            )
+
+            self.plotter.plot(
+                self,
+                output,
+                bbox,
+                crs,
+                format,
+                height * block_rows + top + bottom,
+                layer_objs,
+                styles,
+                version,
+                width * block_columns + left + right,
+                transparent=transparent,
+                **kwargs,
+            )
+
+            block = compositing.split(
+                output.content(),
+                block_columns,
+                block_rows,
+                format,
+                alpha=transparent,
+                margins=margins,
+            )
+
+            contents = {}
+            for j, row in enumerate(block):
+                for i, content in enumerate(row):
+                    position = (grid.name, zoom, x0 + i, y0 + j)
+                    key = caching.key("getmap", dict(params, tile=position), layer_objs)
+                    caching.put(key, content)
+                    contents[(x0 + i, y0 + j)] = content
+
+            return contents
+
+        # the neighbouring tiles requested at the same time by a client wait
+        # for the same block
+        key = caching.key(
+            "metatile",
+            dict(params, tile=(grid.name, zoom, x0, y0), metatile=self.metatile),
+            layer_objs,
+        )
+        return self.coalescing.do(key, render)[(x, y)]
+
+    def stats(self) -> dict:
+        """Returns the metrics of the caches (including the cache of grids), of
+        the coalescing of requests, of the prefetching of time steps and of the
+        render pool."""
+        render_pool = getattr(self.plotter, "render_pool", None)
+        return dict(
+            generation=self.availability.generation,
+            caching=self.caching.stats(),
+            legend_caching=self.legend_caching.stats(),
+            static_caching=self.static_caching.stats(),
+            grid_cache=(
+                self.grid_cache.stats() if self.grid_cache is not None else None
+            ),
+            coalescing=self.coalescing.stats(),
+            prefetch=self.prefetcher.stats() if self.prefetcher is not None else None,
+            render_pool=render_pool.stats() if render_pool is not None else None,
+        )
+
+    def warm_static_tiles(
+        self,
+        max_zoom: int,
+        crss=("EPSG:3857", "EPSG:4326"),
+        format="image/png",
+        size=256,
+        transparent=True,
+    ) -> int:
+        """Renders the tiles of the static layers (e.g. coastlines) down to
+        `max_zoom` on the tile grids of `crss`, so that they are cached.
+        Returns the number of tiles rendered.
+        """
+        count = 0
+        for layer in self.plotter.layers():
+            if not layer.static:
+                continue
+            for crs in crss:
+                grid = tiles.TILE_GRIDS[crs]
+                for zoom in range(max_zoom + 1):
+                    for x, y in grid.tiles(zoom):
+                        output = self.static_caching.create_output()
+                        try:
+                            self.get_map(
+                                output,
+                                grid.bbox(zoom, x, y),
+                                crs,
+                                format,
+                                size,
+                                [layer.name],
+                                "1.1.1",  # x/y axis order
+                                size,
+                                transparent=transparent,
+                            )
+                            count += 1
+                        except Exception as e:
+                            LOG.warning(
+                                "Cannot render tile %s/%s/%s of %s: %s",
+                                zoom,
+                                x,
+                                y,
+                                layer.name,
+                                e,
+                            )
+                        finally:
+                            output.cleanup()
+
+        LOG.info("Rendered %s static tiles", count)
+        return count
+
+    def warm_legends(self, version="1.3.0", **kwargs) -> int:
+        """Renders the legends of all the styles of the data layers, with the
+        default size unless specified otherwise, so that they are cached.
+        Returns the number of legends rendered.
+        """
+        count = 0
+        for layer in self.availability.layers():
+            for style in layer.styles or []:
+                output = self.legend_caching.create_output()
+                try:
+                    self.get_legend(
+                        output, layer.name, version, style=style.name, **kwargs
+                    )
+                    count += 1
+                except Exception as e:
+                    LOG.warning(
+                        "Cannot render legend of %s (style %s): %s",
+                        layer.name,
+                        style.name,
+                        e,
+                    )
+                finally:
+                    output.cleanup()
+
+        LOG.info("Rendered %s legends", count)
+        return count
+
+    def capabilities_rendered(self, version) -> bool:
+        """Returns True if the capabilities document of a version of the
+        protocol is up to date, so that it is served without rendering."""
+        with self._capabilities_lock:
+            capabilities = self._capabilities.get(version)
+        return (
+            capabilities is not None
+            and capabilities.generation == self.availability.generation
+        )
+
+    def capabilities(self, version, service_url, render_template) -> Capabilities:
+        """Returns the capabilities document of a version of the protocol. The
+        document is rendered once, and again only when the availability changes.
+        """
+        # read before the layers are (possibly) loaded or updated, so that
+        # any change while rendering invalidates the document
+        generation = self.availability.generation
+
+        with self._capabilities_lock:
+            capabilities = self._capabilities.get(version)
+
+        if capabilities is None or capabilities.generation != generation:
+            content_type, content = self.get_capabilities(
+                version, SERVICE_URL, render_template
+            )
+            capabilities = Capabilities(generation, content_type, content)
+            with self._capabilities_lock:
+                self._capabilities[version] = capabilities
+
+        return capabilities.with_service_url(service_url)
 
     def get_capabilities(self, version, service_url, render_template):
 
@@ -1,4 +1,4 @@
-from skinnywms.wmssvr import application
+import sys
 
 __all__ = [
     "main",
@@ -6,6 +6,13 @@ __all__ = [
 
 
 def main():
+    if sys.argv[1:2] == ["warm"]:
+        from skinnywms.warm import main as warm
+
+        sys.exit(warm(sys.argv[2:]))
+
+    from skinnywms.wmssvr import application
+
     application.run(debug=True, threaded=False)
 
 
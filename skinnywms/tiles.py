@@ -0,0 +1,170 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+import math
+
+__all__ = [
+    "TILE_GRIDS",
+    "TileGrid",
+    "locate",
+]
+
+# Tolerance, as a fraction of the size of a tile, when matching a bounding box
+# with a tile, to allow for the rounding of the coordinates sent by clients
+# (a quarter of a pixel for tiles of 256 pixels)
+TOLERANCE = 1e-3
+
+
+class TileGrid:
+    """A pyramid of tiles covering the extent of a CRS, such as the tile matrix
+    sets used by tiled web clients (e.g. Leaflet or OpenLayers).
+
+    :param name: name of the tile grid
+    :param crs: name of the CRS of the tiles
+    :param extent: bounding box (min_x, min_y, max_x, max_y) of the grid
+    :param columns: number of columns of tiles at zoom level 0
+    :param rows: number of rows of tiles at zoom level 0
+    :param max_zoom: the deepest zoom level
+    """
+
+    def __init__(
+        self,
+        name: str,
+        crs: str,
+        extent: tuple,
+        columns: int = 1,
+        rows: int = 1,
+        max_zoom: int = 24,
+    ):
+        self.name = name
+        self.crs = crs
+        self.extent = extent
+        self.columns = columns
+        self.rows = rows
+        self.max_zoom = max_zoom
+
+    def span(self, zoom: int) -> tuple:
+        """Returns the width and height of the tiles at a zoom level."""
+        min_x, min_y, max_x, max_y = self.extent
+        n = 2**zoom
+        return (max_x - min_x) / (self.columns * n), (max_y - min_y) / (self.rows * n)
+
+    def size(self, zoom: int) -> tuple:
+        """Returns the number of columns and rows of tiles at a zoom level."""
+        n = 2**zoom
+        return self.columns * n, self.rows * n
+
+    def bbox(self, zoom: int, x: int, y: int) -> tuple:
+        """Returns the bounding box of a tile. Tiles are numbered from the
+        top left corner of the grid."""
+        min_x, _, _, max_y = self.extent
+        dx, dy = self.span(zoom)
+        return (
+            min_x + x * dx,
+            max_y - (y + 1) * dy,
+            min_x + (x + 1) * dx,
+            max_y - y * dy,
+        )
+
+    def tiles(self, zoom: int, bbox: tuple = None):
+        """Yields the positions (x, y) of the tiles at a zoom level, or only
+        of those that intersect `bbox`."""
+        columns, rows = self.size(zoom)
+        x0, y0, x1, y1 = 0, 0, columns, rows
+        if bbox is not None:
+            min_x, min_y, max_x, max_y = bbox
+            ext_min_x, _, _, ext_max_y = self.extent
+            dx, dy = self.span(zoom)
+            x0 = max(x0, math.floor((min_x - ext_min_x) / dx))
+            x1 = min(x1, math.ceil((max_x - ext_min_x) / dx))
+            y0 = max(y0, math.floor((ext_max_y - max_y) / dy))
+            y1 = min(y1, math.ceil((ext_max_y - min_y) / dy))
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                yield x, y
+
+    def locate(self, bbox: tuple, width_tiles: int = 1, height_tiles: int = 1):
+        """Returns the zoom level and the position (x, y) of the top left tile
+        of a block of `width_tiles` by `height_tiles` tiles whose bounding box
+        is `bbox`, or None if `bbox` is not aligned on the grid.
+        """
+        min_x, min_y, max_x, max_y = bbox
+        ext_min_x, _, ext_max_x, ext_max_y = self.extent
+
+        ratio = (ext_max_x - ext_min_x) / (
+            self.columns * (max_x - min_x) / width_tiles
+        )
+        if ratio <= 0:
+            return None
+        zoom = round(math.log2(ratio))
+        if zoom < 0 or zoom > self.max_zoom:
+            return None
+
+        dx, dy = self.span(zoom)
+        if not _close((max_x - min_x) / width_tiles, dx):
+            return None
+        if not _close((max_y - min_y) / height_tiles, dy):
+            return None
+
+        x = (min_x - ext_min_x) / dx
+        y = (ext_max_y - max_y) / dy
+        if not (_close(x, round(x), 1) and _close(y, round(y), 1)):
+            return None
+
+        columns, rows = self.size(zoom)
+        x, y = int(round(x)), int(round(y))
+        if x < 0 or y < 0 or x + width_tiles > columns or y + height_tiles > rows:
+            return None
+
+        return zoom, x, y
+
+    def __repr__(self):
+        return "TileGrid[%s]" % (self.name,)
+
+
+def _close(a: float, b: float, scale: float = None) -> bool:
+    if scale is None:
+        scale = abs(b)
+    return abs(a - b) <= TOLERANCE * scale
+
+
+WEB_MERCATOR_EXTENT = 20037508.342789244
+
+TILE_GRIDS = {
+    "EPSG:3857": TileGrid(
+        "WebMercatorQuad",
+        "EPSG:3857",
+        (
+            -WEB_MERCATOR_EXTENT,
+            -WEB_MERCATOR_EXTENT,
+            WEB_MERCATOR_EXTENT,
+            WEB_MERCATOR_EXTENT,
+        ),
+    ),
+    "EPSG:4326": TileGrid(
+        "WorldCRS84Quad",
+        "EPSG:4326",
+        (-180.0, -90.0, 180.0, 90.0),
+        columns=2,
+    ),
+}
+
+
+def locate(crs: str, bbox: tuple, width_tiles: int = 1, height_tiles: int = 1):
+    """Returns the tile grid of a CRS and the position (zoom, x, y) of the
+    tile, or block of tiles, whose bounding box (in x/y order) is `bbox`.
+    Returns None if there is no tile grid for the CRS, or if `bbox` is not
+    aligned on it.
+    """
+    grid = TILE_GRIDS.get(crs)
+    if grid is None:
+        return None
+    position = grid.locate(bbox, width_tiles, height_tiles)
+    if position is None:
+        return None
+    return (grid,) + position
@@ -0,0 +1,339 @@
+# (C) Copyright 2012-2019 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation nor
+# does it submit to any jurisdiction.
+
+"""Renders a set of maps into the cache of the server, e.g. before a forecast
+is published:
+
+    skinny-wms warm --path /data --cache-dir /cache --layers '2t*' --zoom 0-4
+
+The options of the server (data path, styles, cache...) are the same as the
+ones of `skinny-wms`.
+"""
+
+import argparse
+import datetime
+import fnmatch
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from skinnywms import protocol, tiles
+from skinnywms.server import bounding_box
+
+__all__ = [
+    "Warmer",
+    "main",
+]
+
+LOG = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def parse_time(text: str) -> datetime.datetime:
+    value = datetime.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def parse_zoom(text: str) -> range:
+    first, _, last = text.partition("-")
+    return range(int(first), int(last or first) + 1)
+
+
+def parse_bbox(text: str) -> tuple:
+    bbox = tuple(float(x) for x in text.split(","))
+    if len(bbox) != 4:
+        raise argparse.ArgumentTypeError("Expected min_x,min_y,max_x,max_y")
+    return bbox
+
+
+class Progress:
+    """Reports the number of maps rendered and the throughput, every
+    `interval` seconds and when done."""
+
+    def __init__(self, total: int, interval: float = 5.0, stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.done = 0
+        self.failed = 0
+        self._start = self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, ok: bool) -> None:
+        with self._lock:
+            self.done += 1
+            if not ok:
+                self.failed += 1
+            now = time.monotonic()
+            if now - self._last >= self.interval or self.done == self.total:
+                self._last = now
+                self.report(now)
+
+    def report(self, now: float = None) -> None:
+        elapsed = (now or time.monotonic()) - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        print(
+            "%d/%d maps, %d failed, %.1f maps/s, %.0fs elapsed, %.0fs left"
+            % (self.done, self.total, self.failed, rate, elapsed, eta),
+            file=self.stream,
+        )
+
+
+class Warmer:
+    """Renders maps with `WMSServer.get_map`, so that they are cached as if
+    clients had requested them.
+
+    :param server: the WMS server
+    :param layers: glob patterns of the names of the layers to render
+    :param styles: names of the styles to render, "*" for all the styles of a
+        layer, or an empty list for the default style only
+    :param start: earliest time rendered, or None
+    :param end: latest time rendered, or None
+    :param crs: CRS of the maps
+    :param zooms: zoom levels of the tiles to render, or None to render each
+        of `bboxes` as a single map
+    :param bboxes: bounding boxes (in x/y order), either the extents of the
+        tiles rendered, or the maps rendered
+    :param size: width and height of the maps
+    :param format: format of the maps
+    :param transparent: render transparent maps
+    :param version: version of the WMS protocol of the requests of the clients.
+        Tiles are cached whatever the version, other maps only for the version
+        (and the axis order of its bounding boxes) they are rendered with
+    """
+
+    def __init__(
+        self,
+        server,
+        layers=("*",),
+        styles=(),
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        crs: str = "EPSG:3857",
+        zooms=None,
+        bboxes=(),
+        size: int = 256,
+        format: str = "image/png",
+        transparent: bool = True,
+        version: str = "1.1.1",
+    ):
+        self.server = server
+        self.layers = layers
+        self.styles = styles
+        self.start = start
+        self.end = end
+        self.crs = crs
+        self.zooms = zooms
+        self.bboxes = bboxes
+        self.size = size
+        self.format = format
+        self.transparent = transparent
+        self.version = version
+
+    def select_layers(self) -> list:
+        return [
+            layer
+            for layer in self.server.availability.layers()
+            if any(fnmatch.fnmatchcase(layer.name, p) for p in self.layers)
+        ]
+
+    def select_styles(self, layer) -> list:
+        if not self.styles:
+            return [""]
+        names = [style.name for style in (layer.styles or [])]
+        if "*" in self.styles:
+            return names or [""]
+        return [name for name in self.styles if name in names]
+
+    def select_times(self, layer) -> list:
+        times = [
+            t
+            for t in layer.available_times()
+            if (self.start is None or t >= self.start)
+            and (self.end is None or t <= self.end)
+        ]
+        if not times and self.start is None and self.end is None:
+            # a layer without time dimension
+            return [None]
+        return [t.strftime(TIME_FORMAT) for t in times]
+
+    def select_bboxes(self) -> list:
+        if self.zooms is None:
+            return list(self.bboxes)
+
+        grid = tiles.TILE_GRIDS[self.crs]
+        result = []
+        for zoom in self.zooms:
+            seen = set()
+            for bbox in self.bboxes or [None]:
+                for x, y in grid.tiles(zoom, bbox):
+                    if (x, y) not in seen:
+                        seen.add((x, y))
+                        result.append(grid.bbox(zoom, x, y))
+        return result
+
+    def jobs(self) -> list:
+        """Returns the list of (layer, style, time, bbox) of the maps to
+        render."""
+        bboxes = self.select_bboxes()
+        result = []
+        for layer in self.select_layers():
+            for style in self.select_styles(layer):
+                for when in self.select_times(layer):
+                    for bbox in bboxes:
+                        result.append((layer.name, style, when, bbox))
+        return result
+
+    def render(self, name: str, style: str, when, bbox: tuple) -> None:
+        # the bounding box of the request, in the axis order of the version
+        # (swapping the axes back and forth is the same operation)
+        swap = bounding_box.get("{}_{}".format(self.version, self.crs))
+        if swap is not None:
+            bbox = tuple(swap(bbox))
+
+        output = self.server.caching.create_output()
+        try:
+            self.server.get_map(
+                output,
+                bbox,
+                self.crs,
+                self.format,
+                self.size,
+                [name],
+                self.version,
+                self.size,
+                styles=[style],
+                time=when,
+                transparent=self.transparent,
+            )
+        finally:
+            output.cleanup()
+
+    def run(self, workers: int = 1, progress_interval: float = 5.0) -> Progress:
+        jobs = self.jobs()
+        progress = Progress(len(jobs), interval=progress_interval)
+        print("Rendering %d maps" % (len(jobs),), file=progress.stream)
+
+        def render(job):
+            try:
+                self.render(*job)
+                return True
+            except Exception as e:
+                LOG.warning("Cannot render %s: %s", job, e)
+                return False
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in as_completed([executor.submit(render, j) for j in jobs]):
+                progress.update(future.result())
+
+        return progress
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="skinny-wms warm",
+        description="Render maps into the cache of the server. The other options are the ones of skinny-wms.",
+    )
+    parser.add_argument(
+        "--layers",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Layers to render, e.g. '2t*'. Can be repeated (default: all the layers)",
+    )
+    parser.add_argument(
+        "--styles",
+        action="append",
+        default=[],
+        metavar="STYLE",
+        help="Styles to render, or '*' for all the styles of the layers. Can be repeated (default: the default style)",
+    )
+    parser.add_argument(
+        "--start", type=parse_time, help="Earliest time to render (ISO 8601)"
+    )
+    parser.add_argument("--end", type=parse_time, help="Latest time to render (ISO 8601)")
+    parser.add_argument(
+        "--crs",
+        default="EPSG:3857",
+        choices=sorted(tiles.TILE_GRIDS),
+        help="CRS of the maps (default EPSG:3857)",
+    )
+    parser.add_argument(
+        "--zoom",
+        type=parse_zoom,
+        metavar="MIN-MAX",
+        help="Zoom levels of the tiles to render, e.g. 0-4",
+    )
+    parser.add_argument(
+        "--bbox",
+        action="append",
+        type=parse_bbox,
+        default=[],
+        metavar="MIN_X,MIN_Y,MAX_X,MAX_Y",
+        help="Area of the tiles to render with --zoom, or map to render without. Can be repeated.",
+    )
+    parser.add_argument(
+        "--size", type=int, default=256, help="Width and height of the maps"
+    )
+    parser.add_argument("--format", default="image/png", help="Format of the maps")
+    parser.add_argument(
+        "--version",
+        default="1.1.1",
+        choices=sorted(protocol.SUPPORTED_VERSIONS),
+        help="Version of WMS requested by the clients (default 1.1.1). Only maps rendered with --bbox alone depend on it, tiles are cached for all versions",
+    )
+    parser.add_argument(
+        "--opaque", action="store_true", help="Render opaque maps (default: transparent)"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Number of maps rendered in parallel (default 4). Use with --render-workers, as renders in the server process are serialised.",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=5.0,
+        help="Number of seconds between two progress reports",
+    )
+
+    args, rest = parser.parse_known_args(argv)
+    if args.zoom is None and not args.bbox:
+        parser.error("one of --zoom or --bbox is required")
+
+    # the remaining arguments configure the server
+    sys.argv = [sys.argv[0]] + rest
+    from skinnywms.wmssvr import args as server_args
+    from skinnywms.wmssvr import server
+
+    if not server_args.cache_dir:
+        parser.error("maps can only be warmed in an on-disk cache, see --cache-dir")
+
+    warmer = Warmer(
+        server,
+        layers=args.layers or ["*"],
+        styles=args.styles,
+        start=args.start,
+        end=args.end,
+        crs=args.crs,
+        zooms=args.zoom,
+        bboxes=args.bbox,
+        size=args.size,
+        format=args.format,
+        transparent=not args.opaque,
+        version=args.version,
+    )
+    progress = warmer.run(args.jobs, args.progress_interval)
+    return 1 if progress.failed else 0
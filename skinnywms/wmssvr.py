@@ -10,6 +10,7 @@ import argparse
 import logging
 import os
 import re
+import threading
 
 from flask import (
     Flask,
@@ -22,9 +23,13 @@ from flask import (
 )
 from flask_cors import CORS
 
+from .caching import Caching
 from .data.fs import Availability
+from .data.watch import Watcher
+from .grib_bindings.GribField import GRID_CACHE
 from .plot.magics import Plotter, Styler
-from .server import WMSServer
+from .plot.pool import RenderPool
+from .server import NoCaching, WMSServer
 
 logging.basicConfig(level=os.environ.get("LOGLEVEL", "WARN"))
 
@@ -57,6 +62,45 @@ if os.environ.get("SKINNYWMS_CORS_ORIGINS", "") != "":
     else:
         origins = cors_origins.split(",")
 
+render_workers = int(os.environ.get("SKINNYWMS_RENDER_WORKERS", "0") or 0)
+render_queue_size = os.environ.get("SKINNYWMS_RENDER_QUEUE_SIZE", "")
+render_timeout = float(os.environ.get("SKINNYWMS_RENDER_TIMEOUT", "60") or 60)
+
+index_path = os.environ.get("SKINNYWMS_INDEX_PATH", "")
+
+scan_workers = int(os.environ.get("SKINNYWMS_SCAN_WORKERS", "0") or 0)
+
+watch = os.environ.get("SKINNYWMS_WATCH", "") == "1"
+watch_interval = float(os.environ.get("SKINNYWMS_WATCH_INTERVAL", "60") or 60)
+
+cache_memory_size = int(os.environ.get("SKINNYWMS_CACHE_MEMORY_SIZE", "0") or 0)
+cache_dir = os.environ.get("SKINNYWMS_CACHE_DIR", "")
+cache_disk_size = int(os.environ.get("SKINNYWMS_CACHE_DISK_SIZE", "4096") or 4096)
+legend_cache_size = int(os.environ.get("SKINNYWMS_LEGEND_CACHE_SIZE", "16") or 0)
+legend_cache_disk_size = int(
+    os.environ.get("SKINNYWMS_LEGEND_CACHE_DISK_SIZE", "64") or 0
+)
+warm_legends = os.environ.get("SKINNYWMS_WARM_LEGENDS", "") == "1"
+static_cache_size = int(os.environ.get("SKINNYWMS_STATIC_CACHE_SIZE", "0") or 0)
+static_cache_disk_size = int(
+    os.environ.get("SKINNYWMS_STATIC_CACHE_DISK_SIZE", "0") or 0
+)
+warm_static_tiles = int(os.environ.get("SKINNYWMS_WARM_STATIC_TILES", "-1") or -1)
+composite_layers = os.environ.get("SKINNYWMS_COMPOSITE_LAYERS", "") == "1"
+metatile = int(os.environ.get("SKINNYWMS_METATILE", "1") or 1)
+grid_cache_size = int(os.environ.get("SKINNYWMS_GRID_CACHE_SIZE", "256") or 0)
+grid_cache_float32 = os.environ.get("SKINNYWMS_GRID_CACHE_FLOAT32", "") == "1"
+metatile_buffer = int(os.environ.get("SKINNYWMS_METATILE_BUFFER", "64") or 64)
+
+prefetch_depth = int(os.environ.get("SKINNYWMS_PREFETCH_DEPTH", "0") or 0)
+prefetch_workers = int(os.environ.get("SKINNYWMS_PREFETCH_WORKERS", "1") or 1)
+prefetch_max_load = os.environ.get("SKINNYWMS_PREFETCH_MAX_LOAD", "")
+
+max_age = int(os.environ.get("SKINNYWMS_MAX_AGE", "0") or 0)
+layer_max_age = [
+    x for x in os.environ.get("SKINNYWMS_LAYER_MAX_AGE", "").split(",") if x
+]
+
 
 parser = argparse.ArgumentParser(description="Simple WMS server")
 
@@ -111,7 +155,194 @@ parser.add_argument(
     default="",
     help="Comma-separated list of CORS origins, e.g. http://localhost:5000, https://example.com or '*' to allow all origins. If not specified, CORS is disabled.",
 )
-args = parser.parse_args()
+
+parser.add_argument(
+    "--render-workers",
+    type=int,
+    default=render_workers,
+    help="Number of Magics render worker processes. If 0 (the default), maps are rendered in the server process, one at a time.",
+)
+
+parser.add_argument(
+    "--render-queue-size",
+    type=int,
+    default=int(render_queue_size) if render_queue_size != "" else None,
+    help="Maximum number of requests waiting for a free render worker (default: 4 per worker)",
+)
+
+parser.add_argument(
+    "--render-timeout",
+    type=float,
+    default=render_timeout,
+    help="Maximum number of seconds a render worker may spend on a single map",
+)
+
+parser.add_argument(
+    "--index",
+    default=index_path,
+    help="Path to a file where the fields found in the data files are indexed, so that only new or modified files are scanned on startup. The file can be shared by several server processes.",
+)
+
+parser.add_argument(
+    "--scan-workers",
+    type=int,
+    default=scan_workers,
+    help="Number of processes scanning the data files in parallel. If 0 (the default), files are scanned one after the other.",
+)
+
+parser.add_argument(
+    "--watch",
+    action="store_true",
+    default=watch,
+    help="Watch the data path and add, replace or remove layers when files are added, modified or deleted",
+)
+
+parser.add_argument(
+    "--watch-interval",
+    type=float,
+    default=watch_interval,
+    help="Number of seconds between two scans of the data path when watching it (used when file system events are not available)",
+)
+
+parser.add_argument(
+    "--cache-memory-size",
+    type=int,
+    default=cache_memory_size,
+    help="Size in MB of the in-memory cache of rendered maps. If 0 (the default), maps are not cached in memory.",
+)
+
+parser.add_argument(
+    "--cache-dir",
+    default=cache_dir,
+    help="Directory of the on-disk cache of rendered maps. If not specified, maps are not cached on disk.",
+)
+
+parser.add_argument(
+    "--cache-disk-size",
+    type=int,
+    default=cache_disk_size,
+    help="Size in MB of the on-disk cache, including the legends and the tiles of static layers (see --legend-cache-disk-size and --static-cache-disk-size)",
+)
+
+parser.add_argument(
+    "--legend-cache-size",
+    type=int,
+    default=legend_cache_size,
+    help="Size in MB of the in-memory cache of legends (default 16)",
+)
+
+parser.add_argument(
+    "--legend-cache-disk-size",
+    type=int,
+    default=legend_cache_disk_size,
+    help="Size in MB of the on-disk cache of legends, in the 'legends' subdirectory of --cache-dir (default 64). It is part of --cache-disk-size.",
+)
+
+parser.add_argument(
+    "--warm-legends",
+    action="store_true",
+    default=warm_legends,
+    help="Render the legends of all the styles of all the layers on startup, so that they are cached",
+)
+
+parser.add_argument(
+    "--static-cache-size",
+    type=int,
+    default=static_cache_size,
+    help="Size in MB of the in-memory cache of the tiles of static layers, e.g. coastlines. If 0 (the default), they are not cached in memory.",
+)
+
+parser.add_argument(
+    "--static-cache-disk-size",
+    type=int,
+    default=static_cache_disk_size,
+    help="Size in MB of the on-disk cache of the tiles of static layers, in the 'static' subdirectory of --cache-dir. It is part of --cache-disk-size. If 0 (the default), they are not cached on disk.",
+)
+
+parser.add_argument(
+    "--warm-static-tiles",
+    type=int,
+    default=warm_static_tiles,
+    metavar="ZOOM",
+    help="Render the tiles of the static layers down to this zoom level on startup, so that they are cached",
+)
+
+parser.add_argument(
+    "--composite-layers",
+    action="store_true",
+    default=composite_layers,
+    help="Render and cache each layer of a map separately, and composite them (requires Pillow)",
+)
+
+parser.add_argument(
+    "--metatile",
+    type=int,
+    default=metatile,
+    metavar="N",
+    help="Render the tiles requested by tiled clients by blocks of NxN tiles, and cache them (requires Pillow and a cache). If 1 (the default), tiles are rendered one by one.",
+)
+
+parser.add_argument(
+    "--grid-cache-size",
+    type=int,
+    default=grid_cache_size,
+    metavar="MB",
+    help="Size in MB of the in-memory cache of the coordinates of GRIB grids (0 to disable)",
+)
+
+parser.add_argument(
+    "--grid-cache-float32",
+    action="store_true",
+    default=grid_cache_float32,
+    help="Cache the coordinates of GRIB grids as 32 bits floats, halving the memory they use",
+)
+
+parser.add_argument(
+    "--metatile-buffer",
+    type=int,
+    default=metatile_buffer,
+    metavar="PIXELS",
+    help="Number of pixels rendered around the blocks of tiles and then cropped, so that contours and labels match across their edges",
+)
+
+parser.add_argument(
+    "--prefetch-depth",
+    type=int,
+    default=prefetch_depth,
+    metavar="N",
+    help="When the time steps of a map are requested one after the other (e.g. by an animation), render the next N time steps in the background, so that they are cached (requires a cache). If 0 (the default), nothing is prefetched.",
+)
+
+parser.add_argument(
+    "--prefetch-workers",
+    type=int,
+    default=prefetch_workers,
+    help="Number of time steps prefetched at the same time (default 1)",
+)
+
+parser.add_argument(
+    "--prefetch-max-load",
+    type=float,
+    default=float(prefetch_max_load) if prefetch_max_load != "" else None,
+    help="Load average per CPU above which nothing is prefetched. If not specified, the load of the machine is ignored, but prefetching still waits for the maps requested by clients.",
+)
+
+parser.add_argument(
+    "--max-age",
+    type=int,
+    default=max_age,
+    help="Number of seconds clients may reuse a map or a legend without revalidating it (Cache-Control: max-age). If 0 (the default), clients must revalidate.",
+)
+
+parser.add_argument(
+    "--layer-max-age",
+    action="append",
+    default=layer_max_age,
+    metavar="LAYER=SECONDS",
+    help="Overrides --max-age for a layer. Can be repeated.",
+)
+# ignore the arguments of the ASGI server when imported by it
+args, _ = parser.parse_known_args()
 
 if args.style != "":
     os.environ["MAGICS_STYLE_PATH"] = args.style + ":ecmwf"
@@ -136,19 +367,111 @@ if origins:
 
 group_dimensions = args.enable_dimension_grouping or enable_dimension_grouping
 
+render_pool = None
+if args.render_workers > 0:
+    render_pool = RenderPool(
+        workers=args.render_workers,
+        queue_size=args.render_queue_size,
+        timeout=args.render_timeout,
+    )
+
+# the legends and the tiles of static layers are cached in subdirectories of
+# the cache of the maps, and share its size
+legend_disk = bool(args.cache_dir) and args.legend_cache_disk_size > 0
+static_disk = bool(args.cache_dir) and args.static_cache_disk_size > 0
+maps_disk_size = args.cache_disk_size
+if legend_disk:
+    maps_disk_size -= args.legend_cache_disk_size
+if static_disk:
+    maps_disk_size -= args.static_cache_disk_size
+if args.cache_dir and maps_disk_size <= 0:
+    parser.error("--cache-disk-size is too small for the other on-disk caches")
+
+caching = NoCaching()
+if args.cache_memory_size > 0 or args.cache_dir:
+    caching = Caching(
+        memory_size=args.cache_memory_size * 1024 * 1024,
+        directory=args.cache_dir or None,
+        disk_size=maps_disk_size * 1024 * 1024,
+    )
+
+legend_caching = NoCaching()
+if args.legend_cache_size > 0 or legend_disk:
+    legend_caching = Caching(
+        memory_size=args.legend_cache_size * 1024 * 1024,
+        directory=os.path.join(args.cache_dir, "legends") if legend_disk else None,
+        disk_size=args.legend_cache_disk_size * 1024 * 1024,
+    )
+
+static_caching = NoCaching()
+if args.static_cache_size > 0 or static_disk:
+    static_caching = Caching(
+        memory_size=args.static_cache_size * 1024 * 1024,
+        directory=os.path.join(args.cache_dir, "static") if static_disk else None,
+        disk_size=args.static_cache_disk_size * 1024 * 1024,
+    )
+elif args.warm_static_tiles >= 0:
+    parser.error(
+        "--warm-static-tiles requires --static-cache-size or --static-cache-disk-size"
+    )
+
+GRID_CACHE.configure(
+    max_bytes=args.grid_cache_size * 1024 * 1024,
+    dtype="float32" if args.grid_cache_float32 else "float64",
+)
+
+layer_max_age = {}
+for item in args.layer_max_age:
+    name, _, seconds = item.rpartition("=")
+    layer_max_age[name] = int(seconds)
+
 server = WMSServer(
-    Availability(args.path, group_dimensions=group_dimensions),
+    Availability(
+        args.path,
+        group_dimensions=group_dimensions,
+        index_path=args.index or None,
+        scan_workers=args.scan_workers,
+    ),
     Plotter(
         args.baselayer,
         dark_mode=dark_mode_enabled,
         omit_default_layers=omit_default_layers,
+        render_pool=render_pool,
     ),
     Styler(args.user_style, dark_mode=dark_mode_enabled),
+    caching=caching,
+    max_age=args.max_age,
+    layer_max_age=layer_max_age,
+    legend_caching=legend_caching,
+    static_caching=static_caching,
+    composite_layers=args.composite_layers,
+    metatile=args.metatile,
+    metatile_buffer=args.metatile_buffer,
+    prefetch_depth=args.prefetch_depth,
+    prefetch_workers=args.prefetch_workers,
+    prefetch_max_load=args.prefetch_max_load,
+    grid_cache=GRID_CACHE,
 )
 
 
 server.magics_prefix = args.magics_prefix
 
+if args.watch:
+    Watcher(server.availability, args.path, interval=args.watch_interval).start()
+
+if args.warm_static_tiles >= 0:
+    threading.Thread(
+        target=server.warm_static_tiles,
+        args=(args.warm_static_tiles,),
+        name="skinnywms-static-tiles",
+        daemon=True,
+    ).start()
+
+if args.warm_legends:
+    threading.Thread(
+        target=server.warm_legends, name="skinnywms-legends", daemon=True
+    ).start()
+
 
 @application.route("/wms", methods=["GET"])
 def wms():
@@ -166,10 +489,22 @@ def availability():
     return jsonify(server.availability.as_dict())
 
 
+@application.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify(server.stats())
+
+
 @application.route("/", methods=["GET"])
 def index():
     return render_template("leaflet_demo.html")
 
 
 def execute():
-    application.run(port=args.port, host=args.host, debug=True, threaded=False)
+    # requests can only be rendered concurrently if flask serves them from
+    # several threads
+    application.run(
+        port=args.port,
+        host=args.host,
+        debug=True,
+        threaded=render_pool is not None,
+    )
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+
+from skinnywms.asgi import WMSApplication
+
+
+class Availability:
+    def layers(self):
+        return []
+
+    def as_dict(self):
+        return {}
+
+
+class Server:
+    def __init__(self):
+        self.availability = Availability()
+        self.rendering = threading.Event()
+        self.release = threading.Event()
+        self.rendered = True
+        self.threads = []
+
+    def capabilities_rendered(self, version):
+        return self.rendered
+
+    def process(self, request, Response, send_file, render_template):
+        self.threads.append(threading.current_thread())
+        if request.args["request"] == "GetMap":
+            self.rendering.set()
+            self.release.wait()
+            return Response(b"png", mimetype="image/png")
+        return Response("<capabilities/>", mimetype="text/xml")
+
+    def stats(self):
+        return {}
+
+
+async def call(application, query):
+    scope = dict(
+        type="http",
+        method="GET",
+        path="/wms",
+        query_string=query.encode(),
+        headers=[(b"host", b"localhost")],
+    )
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]["status"], messages[1]["body"]
+
+
+def test_overloaded():
+    server = Server()
+    application = WMSApplication(
+        server, None, concurrency=1, queue_size=1, queue_timeout=0.2
+    )
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        rendering = asyncio.ensure_future(call(application, "request=GetMap"))
+        await loop.run_in_executor(None, server.rendering.wait)
+
+        # capabilities are not held up by the render
+        assert await call(application, "request=GetCapabilities") == (
+            200,
+            b"<capabilities/>",
+        )
+
+        # one request waits, and times out
+        waiting = asyncio.ensure_future(call(application, "request=GetMap"))
+        await asyncio.sleep(0.05)
+
+        # the queue is full
+        status, body = await call(application, "request=GetMap")
+        assert status == 503
+        assert b"ServiceExceptionReport" in body
+
+        status, _ = await waiting
+        assert status == 503
+
+        server.release.set()
+        assert await rendering == (200, b"png")
+
+    asyncio.run(run())
+    assert application.rejected == 1
+    assert application.timed_out == 1
+
+
+def test_capabilities_rendered_in_executor():
+    server = Server()
+    application = WMSApplication(server, None)
+    application.load()
+
+    async def run():
+        await call(application, "request=GetCapabilities")
+        server.rendered = False
+        await call(application, "request=GetCapabilities")
+
+    asyncio.run(run())
+    # up to date documents are served by the event loop, the others are
+    # rendered in another thread
+    assert server.threads[0] is threading.current_thread()
+    assert server.threads[1] is not threading.current_thread()
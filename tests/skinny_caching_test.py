@@ -0,0 +1,127 @@
+import os
+
+from skinnywms import server
+from skinnywms.caching import Caching, DiskCache, MemoryCache
+from skinnywms.server import MemoryFile
+
+
+class Layer:
+    def __init__(self, name, path=None):
+        self.name = name
+        self.path = path
+
+    def __repr__(self):
+        return "Layer[%s]" % (self.name,)
+
+
+def test_memory_cache_lru():
+
+    cache = MemoryCache(10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+
+    # "b" is the least recently used entry
+    cache.put("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"1234"
+    assert cache.evictions == 1
+
+
+def test_disk_cache_budget(tmp_path):
+
+    cache = DiskCache(str(tmp_path), 100)
+    for i in range(10):
+        cache.put("%064x" % i, b"x" * 20)
+
+    assert cache.stats()["bytes"] <= 100
+    assert cache.get("%064x" % 9) == b"x" * 20
+    assert cache.get("%064x" % 0) is None
+
+    # the size of the directory is recomputed on startup
+    assert DiskCache(str(tmp_path), 100).stats()["bytes"] == cache.stats()["bytes"]
+
+
+def test_disk_cache_overwrite(tmp_path):
+
+    cache = DiskCache(str(tmp_path), 100)
+    for size in (60, 60, 30):
+        cache.put("%064x" % 0, b"x" * size)
+
+    # the size of the entry that is replaced is not counted twice
+    assert cache.stats()["bytes"] == 30
+    assert cache.evictions == 0
+    assert cache.get("%064x" % 0) == b"x" * 30
+
+
+def test_nested_disk_caches(tmp_path):
+
+    # e.g. the cache of legends, in the directory of the cache of maps
+    legends = DiskCache(str(tmp_path / "legends"), 1000)
+    legends.put("%064x" % 0, b"x" * 50)
+
+    maps = DiskCache(str(tmp_path), 100)
+    assert maps.stats()["bytes"] == 0
+    for i in range(10):
+        maps.put("%064x" % i, b"x" * 20)
+
+    assert maps.stats()["bytes"] <= 100
+    assert legends.get("%064x" % 0) == b"x" * 50
+
+
+def test_caching_keys(tmp_path):
+
+    data = tmp_path / "data.grib"
+    data.write_bytes(b"GRIB")
+
+    caching = Caching(memory_size=1000, directory=str(tmp_path / "cache"))
+
+    params = dict(bbox=(0, 0, 10, 10), width=256, height=256)
+    key = caching.key("getmap", params, [Layer("2t", str(data))])
+
+    assert key == caching.key("getmap", dict(params), [Layer("2t", str(data))])
+    assert key != caching.key("getmap", params, [Layer("msl", str(data))])
+    assert key != caching.key(
+        "getmap", dict(params, width=512), [Layer("2t", str(data))]
+    )
+
+    caching.put(key, b"png")
+    assert caching.get(key) == b"png"
+
+    # served by the disk tier after a restart
+    assert Caching(directory=str(tmp_path / "cache")).get(key) == b"png"
+
+    # a file modification changes the key
+    data.write_bytes(b"GRIB2")
+    assert key != caching.key("getmap", params, [Layer("2t", str(data))])
+
+
+def test_memory_file(tmp_path, monkeypatch):
+
+    # plots are written in the RAM-backed directory if there is one
+    monkeypatch.setattr(server, "SHM_DIRECTORY", str(tmp_path))
+    output = MemoryFile()
+    assert output.directory == str(tmp_path)
+    monkeypatch.setattr(server, "SHM_DIRECTORY", str(tmp_path / "missing"))
+    assert MemoryFile().directory is None
+
+    fname = output.target("png")
+    assert os.path.dirname(fname) == str(tmp_path)
+    with open(fname, "wb") as f:
+        f.write(b"png")
+
+    # the file is removed once read
+    assert output.content() == b"png"
+    assert os.listdir(tmp_path) == []
+    output.cleanup()
+    output.cleanup()
+
+    # as well as the previous file when the output is reused
+    first = output.target("png")
+    second = output.target("svg")
+    assert os.listdir(tmp_path) == [os.path.basename(second)]
+    assert not os.path.exists(first)
+    output.cleanup()
+    output.cleanup()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from skinnywms.coalescing import SingleFlight
+
+
+def test_single_flight():
+
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def render():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return b"png"
+
+    results = []
+
+    def request():
+        results.append(flight.do("key", render))
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    started.wait()
+
+    followers = [threading.Thread(target=request) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while flight.coalesced < 3:
+        threading.Event().wait(0.01)
+
+    release.set()
+    for t in [leader] + followers:
+        t.join()
+
+    assert results == [b"png"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == dict(in_flight=0, calls=1, coalesced=3)
+
+    # not coalesced once done
+    assert flight.do("key", render) == b"png"
+    assert len(calls) == 2
+
+
+def test_single_flight_error():
+
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("error")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    assert flight.stats()["in_flight"] == 0
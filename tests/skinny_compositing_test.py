@@ -0,0 +1,57 @@
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from skinnywms.compositing import composite, decode, split
+
+
+def png(colour, size=(4, 2)):
+    buffer = io.BytesIO()
+    Image.new("RGBA", size, colour).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_composite():
+
+    background = png((0, 0, 255, 255))
+    overlay = png((255, 0, 0, 128))
+    empty = png((0, 0, 0, 0))
+
+    rgba = decode(composite([background, empty, overlay]))
+    assert rgba.shape == (2, 4, 4)
+    assert np.allclose(rgba[0, 0], [128 / 255, 0, 127 / 255, 1], atol=1 / 255)
+
+    # the top layer only
+    rgba = decode(composite([empty, overlay]))
+    assert np.allclose(rgba[0, 0], [1, 0, 0, 128 / 255], atol=1 / 255)
+
+    # over the background colour
+    rgba = decode(composite([empty, overlay], transparent=False, bgcolor="0x00FF00"))
+    assert np.allclose(rgba[0, 0], [128 / 255, 127 / 255, 0, 1], atol=1 / 255)
+
+
+def test_composite_sizes():
+
+    with pytest.raises(ValueError):
+        composite([png((0, 0, 0, 255)), png((0, 0, 0, 255), size=(2, 2))])
+
+
+def test_split():
+
+    buffer = io.BytesIO()
+    image = Image.new("RGBA", (4, 2), (0, 0, 0, 255))
+    image.putpixel((3, 1), (255, 0, 0, 255))
+    image.save(buffer, "PNG")
+
+    tiles = split(buffer.getvalue(), 2, 2)
+    assert [len(row) for row in tiles] == [2, 2]
+    assert decode(tiles[1][1]).shape == (1, 2, 4)
+    assert decode(tiles[1][1])[0, 1].tolist() == [1, 0, 0, 1]
+    assert decode(tiles[0][0])[0, 0].tolist() == [0, 0, 0, 1]
+
+    # margins are cropped first
+    tiles = split(buffer.getvalue(), 1, 1, margins=(1, 0, 2, 1))
+    assert decode(tiles[0][0]).shape == (1, 1, 4)
@@ -0,0 +1,46 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("dateutil")
+
+from skinnywms.datatypes import DataLayer, Field
+
+
+class TestField(Field):
+    __test__ = False
+
+    def __init__(self, time, levelist):
+        self.name = self.group_name = "t"
+        self.title = self.group_title = "Temperature"
+        self.time = time
+        self.levelist = levelist
+
+
+def date(hour):
+    return datetime.datetime(2022, 1, 1, hour, tzinfo=datetime.timezone.utc)
+
+
+def test_select():
+
+    layer = DataLayer(TestField(date(6), 500), group_dimensions=True)
+    for hour in (12, 0):
+        for level in (500, 850):
+            layer.add_field(TestField(date(hour), level))
+
+    assert layer.available_times() == [date(0), date(6), date(12)]
+
+    field = layer.select(dict(time="2022-01-01T12:00:00Z", elevation="850"))
+    assert (field.time, field.levelist) == (date(12), 850)
+    # nearest previous time
+    field = layer.select(dict(time="2022-01-01T09:00:00Z", elevation="500"))
+    assert (field.time, field.levelist) == (date(6), 500)
+
+    with pytest.raises(KeyError):
+        layer.select(dict(time="2021-12-31T00:00:00Z"))
+
+    # fields are re-indexed when they are updated
+    removed = layer.select(dict(time="2022-01-01T00:00:00Z", elevation="500"))
+    layer.update_fields([TestField(date(18), 500)], [removed])
+    assert layer.available_times() == [date(0), date(6), date(12), date(18)]
+    assert layer.select(dict(time="2022-01-01T00:00:00Z")).levelist == 850
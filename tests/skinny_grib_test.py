@@ -0,0 +1,142 @@
+import datetime
+import os
+import pickle
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from skinnywms.grids import reduced_grid
+
+try:
+    from skinnywms.fields.GRIBField import GRIBField
+    from skinnywms.grib_bindings import GribFile
+    from skinnywms.grib_bindings.bindings import METADATA_KEYS
+    from skinnywms.grib_bindings.GribField import GridCache
+except Exception:  # ecCodes not available
+    GRIBField = GridCache = None
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), "data", "example.grib")
+
+needs_eccodes = pytest.mark.skipif(
+    GridCache is None, reason="GRIB bindings not available"
+)
+
+
+def reference_reduced_grid(pl_array, latitudes):
+    for pl, lat in zip(pl_array, latitudes):
+        if pl == 0:
+            continue
+
+        for n in range(0, pl):
+            lon = (360.0 * n) / pl
+            yield lat, lon
+
+
+def test_reduced_grid():
+
+    # an octahedral grid, with an empty row
+    pl_array = [20, 24, 28, 0, 28, 24, 20]
+    latitudes = np.linspace(80, -80, len(pl_array))
+
+    lats, lons = reduced_grid(pl_array, latitudes)
+    expected = list(reference_reduced_grid(pl_array, latitudes))
+
+    assert len(lats) == len(lons) == sum(pl_array)
+    assert lats.tolist() == [lat for lat, _ in expected]
+    assert lons.tolist() == [lon for _, lon in expected]
+
+
+@needs_eccodes
+def test_grid_cache():
+
+    cache = GridCache(max_bytes=1800, dtype=np.float32)
+    assert cache.get("a") == (None, None)
+
+    coords, _ = cache.put("a", dict(latitude=("rgrid", np.zeros(100))), {})
+    assert coords["latitude"][1].dtype == np.float32
+    assert cache.get("a")[0] is coords
+    assert cache.stats()["bytes"] == 400
+
+    cache.put("b", dict(latitude=np.zeros(200)), {})
+    cache.put("c", dict(latitude=np.zeros(200)), {})
+    assert cache.get("a") == (None, None)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hits"] == 1
+
+    # e.g. from the server options
+    cache.configure(max_bytes=1000)
+    assert len(cache) == 1 and cache.stats()["evictions"] == 2
+    cache.configure(dtype="float64")
+    assert len(cache) == 0
+    coords, _ = cache.put("a", dict(latitude=np.zeros(100, dtype=np.float32)), {})
+    assert coords["latitude"].dtype == np.float64
+    assert cache.stats()["dtype"] == "float64"
+
+
+class Message:
+    # the keys of a GRIB message read by GRIBField
+    def __init__(self, shortName, offset):
+        self.shortName = shortName
+        self.name = shortName.upper()
+        self.levtype = "pl"
+        self.levelist = 500
+        self.byte_offset = offset
+        self.valid_date = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        self.mars_request = dict(param=shortName, levelist="500", step="0")
+        self.metadata = dict(shortName=shortName, levelist=500)
+
+
+class Styler:
+    def grib_styles_from_meta(self, field):
+        return []
+
+
+class Context:
+    def __init__(self):
+        self.stash = {}
+        self.styler = Styler()
+
+
+@needs_eccodes
+def test_grib_field_state():
+    context = Context()
+    u = GRIBField(context, "wind.grib", Message("u", 0), 0)
+    v = GRIBField(context, "wind.grib", Message("v", 100), 1)
+    assert not hasattr(u, "__dict__")
+    assert u.companion is v and v.name == "u/v@pl_500"
+    assert u.mars == dict(param="u", levelist="500", step="0")
+    assert u.metadata == dict(shortName="u/v", levelist="500/500")
+
+    restored = pickle.loads(pickle.dumps([u, v]))
+    for field in restored:
+        field.set_context(context)
+    assert [repr(f) for f in restored] == [repr(u), repr(v)]
+    assert restored[0].companion is restored[1]
+    assert restored[0].styles is u.styles
+
+
+@needs_eccodes
+def test_headers_only():
+
+    full = list(GribFile(EXAMPLE))
+    headers = list(GribFile(EXAMPLE, headers_only=True))
+    assert len(full) == len(headers) == 24
+
+    for a, b in zip(full, headers):
+        # the keys read once and then memoised are the same as those of a
+        # full read
+        keys = a.get_many(METADATA_KEYS)
+        assert b.get_many(METADATA_KEYS) == keys
+        assert b.get_many(METADATA_KEYS) == keys
+        assert b.metadata == a.metadata
+        assert b.mars_request == a.mars_request
+        assert b.valid_date == a.valid_date
+        assert b.byte_offset == a.byte_offset
+        assert b.get("missingKey") is None
+
+        fields = [GRIBField(Context(), EXAMPLE, m, 0) for m in (a, b)]
+        assert fields[0].name == fields[1].name
+        assert fields[0].time == fields[1].time
+        assert fields[0].levelist == fields[1].levelist
+        assert fields[0].metadata == fields[1].metadata
@@ -0,0 +1,177 @@
+import os
+import shutil
+
+import pytest
+
+from skinnywms.data.index import FieldIndex
+
+
+def test_index(tmp_path):
+
+    data = tmp_path / "data.grib"
+    data.write_bytes(b"GRIB")
+    path = str(tmp_path / "skinnywms.index")
+
+    index = FieldIndex(path, signature=dict(version=1))
+    with index.locked():
+        index.load()
+        assert index.lookup(str(data)) is None
+        index.update(str(data), ["2t", "msl"])
+        index.save()
+
+    index = FieldIndex(path, signature=dict(version=1))
+    index.load()
+    assert index.lookup(str(data)) == ["2t", "msl"]
+
+    # modified files must be scanned again
+    data.write_bytes(b"GRIB2")
+    assert index.lookup(str(data)) is None
+
+    # as well as all files when the signature changes
+    index = FieldIndex(path, signature=dict(version=2))
+    index.load()
+    assert len(index) == 0
+
+
+def test_index_prune(tmp_path):
+
+    path = str(tmp_path / "skinnywms.index")
+    files = []
+    for name in ("a.grib", "b.grib"):
+        files.append(str(tmp_path / name))
+        with open(files[-1], "wb") as f:
+            f.write(b"GRIB")
+
+    index = FieldIndex(path)
+    for f in files:
+        index.update(f, [])
+    index.save()
+
+    os.unlink(files[1])
+
+    index = FieldIndex(path)
+    index.load()
+    assert index.lookup(files[0]) == []
+    index.save()
+
+    index.load()
+    assert len(index) == 1
+
+
+class Styler:
+    user_style = None
+
+    def netcdf_styles(self, field, ncvar, path, variable):
+        return []
+
+    def grib_styles_from_meta(self, field):
+        return []
+
+
+class Context:
+    def __init__(self):
+        self.stash = {}
+        self.styler = Styler()
+
+
+def test_index_availability(tmp_path, monkeypatch):
+    pytest.importorskip("netCDF4")
+    try:
+        from skinnywms.data.fs import Availability
+    except Exception:
+        pytest.skip("GRIB bindings not available")
+
+    here = os.path.dirname(__file__)
+    data = tmp_path / "data"
+    data.mkdir()
+    shutil.copy(os.path.join(here, "..", "skinnywms", "testdata", "mslp.nc"), data)
+    shutil.copy(os.path.join(here, "data", "example.grib"), data)
+    index_path = str(tmp_path / "skinnywms.index")
+
+    scanned = []
+    scan_file = Availability.scan_file
+
+    def counting_scan_file(self, path):
+        scanned.append(os.path.basename(path))
+        return scan_file(self, path)
+
+    monkeypatch.setattr(Availability, "scan_file", counting_scan_file)
+
+    # the availability only keeps a weak reference to its context
+    context = Context()
+
+    def load():
+        del scanned[:]
+        availability = Availability(str(data), index_path=index_path)
+        availability.set_context(context)
+        availability.load()
+        return availability
+
+    def selected(availability):
+        return {
+            layer.name: availability.layer(layer.name, None).name
+            for layer in availability.layers()
+        }
+
+    expected = selected(load())
+    assert sorted(scanned) == ["example.grib", "mslp.nc"]
+    assert "msl" in expected and "t@pl_500" in expected
+
+    availability = load()
+    assert scanned == []
+    assert selected(availability) == expected
+    field = availability.layer("t@pl_500", None)
+    assert field.context is context
+    assert field.styles == []
+
+    # modified files are scanned again
+    mslp = str(data / "mslp.nc")
+    os.utime(mslp, (os.path.getatime(mslp), os.path.getmtime(mslp) + 10))
+    assert selected(load()) == expected
+    assert scanned == ["mslp.nc"]
+
+    # as well as all files when the index cannot be read
+    with open(index_path, "wb") as f:
+        f.write(b"garbage")
+    assert selected(load()) == expected
+    assert sorted(scanned) == ["example.grib", "mslp.nc"]
+
+
+def test_index_signature(tmp_path, monkeypatch):
+    try:
+        from skinnywms.data.fs import Availability
+    except Exception:
+        pytest.skip("GRIB bindings not available")
+
+    class Driver:
+        magics = "4.15.0"
+
+        def version(self):
+            return self.magics
+
+    context = Context()
+    context.styler.driver = Driver()
+    availability = Availability(str(tmp_path))
+    availability.set_context(context)
+
+    styles = tmp_path / "styles"
+    styles.mkdir()
+    (styles / "styles.json").write_text("{}")
+    user_style = tmp_path / "user_style.json"
+    user_style.write_text("{}")
+    monkeypatch.setenv("MAGICS_STYLE_PATH", "%s:ecmwf" % (styles,))
+    monkeypatch.setenv("MAGICS_USER_STYLE_PATH", str(user_style))
+
+    signature = availability.index_signature()
+    assert signature == availability.index_signature()
+
+    # stored styles are computed again when Magics is upgraded
+    context.styler.driver.magics = "4.16.0"
+    assert availability.index_signature() != signature
+    signature = availability.index_signature()
+
+    # or when style files are edited
+    for path in (styles / "styles.json", user_style):
+        path.write_text('{"styles": []}')
+        assert availability.index_signature() != signature
+        signature = availability.index_signature()
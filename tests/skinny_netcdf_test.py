@@ -0,0 +1,123 @@
+import datetime
+import os
+
+import pytest
+
+pytest.importorskip("netCDF4")
+pytest.importorskip("dateutil")
+
+import netCDF4
+import numpy as np
+
+from skinnywms.datatypes import Availability
+from skinnywms.fields.NetCDFField import (
+    NetCDFMetadata,
+    NetCDFReader,
+    as_datetime,
+    as_datetimes,
+)
+
+MSLP = os.path.join(os.path.dirname(__file__), "..", "skinnywms", "testdata", "mslp.nc")
+
+
+class Styler:
+    def netcdf_styles(self, field, ncvar, path, variable):
+        return []
+
+
+class Context:
+    def __init__(self):
+        self.stash = {}
+        self.styler = Styler()
+
+
+def test_metadata():
+    ds = NetCDFMetadata(MSLP)
+    assert ds.data_vars == ["msl"]
+    assert ds["msl"].coords == ["longitude", "latitude", "time"]
+    assert ds["msl"].long_name == "Mean sea level pressure"
+    assert str(ds["time"].values[0]) == "2022-08-17T00:00:00.000000000"
+    # the data is not read
+    assert ds["msl"].values is None
+
+
+def test_fields():
+    (cube,) = NetCDFReader(Context(), MSLP).get_fields()
+    assert cube.name == "msl"
+    # time is not a CF time coordinate: the last one is used, as for the
+    # other coordinates
+    assert len(cube) == 1
+    assert [s.index for s in cube.field(None, None).slices] == [3]
+
+
+def test_cube(tmp_path):
+    path = str(tmp_path / "t.nc")
+    with netCDF4.Dataset(path, "w") as ds:
+        for name, size in (("time", 3), ("plev", 2), ("lat", 2), ("lon", 2)):
+            ds.createDimension(name, size)
+            ds.createVariable(name, "f8", (name,))
+        ds["time"].standard_name = "time"
+        ds["time"].units = "hours since 2024-01-01"
+        ds["time"][:] = [0, 6, 12]
+        ds["plev"].standard_name = "air_pressure"
+        ds["plev"].units = "Pa"
+        ds["plev"][:] = [100000, 50000]
+        ds["lat"].standard_name = "latitude"
+        ds["lon"].standard_name = "longitude"
+        ds.createVariable("t", "f4", ("time", "plev", "lat", "lon"))
+
+    (cube,) = NetCDFReader(Context(), path).get_fields()
+    assert len(cube) == 6
+    assert cube.levels == [100000, 50000]
+    when = datetime.datetime(2024, 1, 1, 6, tzinfo=datetime.timezone.utc)
+    assert (when, 50000) in cube
+    assert (when, 85000) not in cube
+
+    field = cube.field(when, 50000)
+    assert (field.time, field.levelist, field.name) == (when, 50000, "t@pl_50000")
+    assert [s.index for s in field.slices] == [1, 1]
+    assert field.styles is cube.first.styles
+
+    levels = cube.split_levels()
+    assert [c.name for c in levels] == ["t@pl_100000", "t@pl_50000"]
+    assert [len(c) for c in levels] == [3, 3]
+
+    # the fields are created when a layer is selected
+    availability = Availability()
+    availability.add_field(cube)
+    selected = availability.layer("t@pl_50000", dict(time="2024-01-01T12:00:00Z"))
+    assert [s.index for s in selected.slices] == [2, 1]
+
+
+def test_as_datetimes():
+    values = np.array(
+        ["1950-06-01T12:30:59.999", "2022-08-17T06:00"], dtype="datetime64[ns]"
+    )
+    times = as_datetimes(None, values)
+    assert times == [as_datetime(None, t) for t in values]
+    assert times[1] == datetime.datetime(2022, 8, 17, 6, tzinfo=datetime.timezone.utc)
+
+
+@pytest.mark.parametrize("calendar", ["noleap", "360_day", "standard"])
+def test_calendars(tmp_path, calendar):
+    path = str(tmp_path / "t.nc")
+    with netCDF4.Dataset(path, "w") as ds:
+        for name, size in (("time", 3), ("lat", 2), ("lon", 2)):
+            ds.createDimension(name, size)
+            ds.createVariable(name, "f8", (name,))
+        ds["time"].standard_name = "time"
+        ds["time"].units = "days since 2000-02-27"
+        ds["time"].calendar = calendar
+        ds["time"][:] = [0, 1, 2.5]
+        ds["lat"].standard_name = "latitude"
+        ds["lon"].standard_name = "longitude"
+        ds.createVariable("tas", "f4", ("time", "lat", "lon"))
+
+    (cube,) = NetCDFReader(Context(), path).get_fields()
+    # there is no 29 February in the 'noleap' calendar
+    last = (3, 1) if calendar == "noleap" else (2, 29)
+    assert cube.times == [
+        datetime.datetime(2000, 2, 27, tzinfo=datetime.timezone.utc),
+        datetime.datetime(2000, 2, 28, tzinfo=datetime.timezone.utc),
+        datetime.datetime(2000, *last, 12, tzinfo=datetime.timezone.utc),
+    ]
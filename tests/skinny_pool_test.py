@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from skinnywms import errors
+from skinnywms.plot.pool import RenderPool
+
+
+def render(job):
+    """Renders the fake Magics actions of the tests."""
+    for verb, args in job:
+        if verb == "output":
+            with open(args["output_name"], "w") as f:
+                f.write("%s" % (os.getpid(),))
+        if verb == "sleep":
+            time.sleep(args["seconds"])
+        if verb == "exit":
+            os._exit(1)
+        if verb == "fail":
+            raise ValueError(args["message"])
+
+
+def action(verb, **args):
+    return SimpleNamespace(verb=verb, args=args)
+
+
+@pytest.fixture
+def pool():
+    pool = RenderPool(workers=1, queue_size=0, timeout=2, render=render)
+    yield pool
+    pool.shutdown()
+
+
+def test_render(tmp_path, pool):
+    path = str(tmp_path / "out.png")
+    pool.plot([action("output", output_name=path)])
+    with open(path) as f:
+        pid = int(f.read())
+    assert pid != os.getpid()
+    assert pool.start_method in ("forkserver", "spawn")
+    assert pool.stats() == dict(workers=1, queue_size=0, started=1, idle=1)
+
+    with pytest.raises(RuntimeError, match="ValueError: bad style"):
+        pool.plot([action("fail", message="bad style")])
+
+    # the worker is still the same
+    pool.plot([action("output", output_name=path)])
+    with open(path) as f:
+        assert int(f.read()) == pid
+
+
+def test_restart(tmp_path, pool):
+    path = str(tmp_path / "out.png")
+    pool.plot([action("output", output_name=path)])
+
+    # workers that time out or die are replaced
+    pool.timeout = 0.5
+    with pytest.raises(TimeoutError):
+        pool.plot([action("sleep", seconds=10)])
+    with pytest.raises(RuntimeError, match="died"):
+        pool.plot([action("exit")])
+
+    pool.plot([action("output", output_name=path)])
+    assert pool.stats()["idle"] == 1
+
+
+def test_queue_full(pool):
+    busy = threading.Thread(target=pool.plot, args=([action("sleep", seconds=1)],))
+    busy.start()
+    try:
+        time.sleep(0.2)
+        with pytest.raises(errors.ServiceUnavailable):
+            pool.plot([action("sleep", seconds=0)])
+    finally:
+        busy.join()
+
+
+def test_shutdown_busy(tmp_path, pool):
+    path = str(tmp_path / "out.png")
+    pool.plot([action("output", output_name=path)])
+    (worker,) = pool._pool
+
+    busy = threading.Thread(target=pool.plot, args=([action("sleep", seconds=0.5)],))
+    busy.start()
+    time.sleep(0.2)
+    pool.shutdown()
+    busy.join()
+
+    # the busy worker is stopped once its render is done, not made idle again
+    assert not worker.process.is_alive()
+    assert pool.stats()["idle"] == 0
+
+    # and a new worker is started on demand
+    pool.plot([action("output", output_name=path)])
+    assert pool.stats()["started"] == 1
@@ -0,0 +1,74 @@
+import datetime
+import threading
+
+from skinnywms.coalescing import SingleFlight
+from skinnywms.prefetch import Prefetcher
+
+TIMES = [
+    datetime.datetime(2024, 1, 1, h, tzinfo=datetime.timezone.utc)
+    for h in range(0, 24, 6)
+]
+
+
+class Availability:
+    generation = 1
+
+    def available_times(self, name):
+        return TIMES if name == "2t" else []
+
+
+class Output:
+    def cleanup(self):
+        pass
+
+
+class Caching:
+    def create_output(self):
+        return Output()
+
+
+class Server:
+    def __init__(self):
+        self.availability = Availability()
+        self.caching = Caching()
+        self.coalescing = SingleFlight()
+        self.plotter = None
+        self.rendered = []
+        self.done = threading.Semaphore(0)
+
+    def get_map(self, output, layers, time, **request):
+        self.rendered.append((layers, time, request["bbox"]))
+        self.done.release()
+
+
+def test_prefetch_next_time_steps():
+    server = Server()
+    prefetcher = Prefetcher(server, depth=2)
+    request = dict(bbox="0,0,10,10", width=256)
+
+    prefetcher.observe(["2t"], "2024-01-01T00:00:00Z", request)
+    # another sequence
+    prefetcher.observe(["2t"], "2024-01-01T06:00:00Z", dict(request, width=512))
+    assert prefetcher.scheduled == 0
+
+    prefetcher.observe(["2t"], "2024-01-01T06:00:00Z", request)
+    for _ in range(2):
+        assert server.done.acquire(timeout=5)
+    assert sorted(server.rendered) == [
+        (["2t"], "2024-01-01T12:00:00Z", "0,0,10,10"),
+        (["2t"], "2024-01-01T18:00:00Z", "0,0,10,10"),
+    ]
+
+    # backwards
+    server.rendered = []
+    prefetcher.observe(["2t"], "2024-01-01T00:00:00Z", request)
+    prefetcher.observe(["2t"], "2024-01-01T18:00:00Z", request)
+    prefetcher.observe(["2t"], "2024-01-01T12:00:00Z", request)
+    assert server.done.acquire(timeout=5)
+    assert server.done.acquire(timeout=5)
+    assert sorted(server.rendered)[0][1] == "2024-01-01T00:00:00Z"
+
+    # unknown times and layers without times are ignored
+    prefetcher.observe(["2t"], "2024-01-01T03:00:00Z", request)
+    prefetcher.observe(["foreground"], "2024-01-01T06:00:00Z", request)
+    assert prefetcher.stats()["failed"] == 0
@@ -0,0 +1,131 @@
+import datetime
+import os
+import weakref
+
+import pytest
+
+pytest.importorskip("dateutil")
+
+from skinnywms import datatypes
+
+try:
+    from skinnywms.data import fs
+except Exception:  # ecCodes not available
+    fs = None
+
+pytestmark = pytest.mark.skipif(fs is None, reason="GRIB bindings not available")
+
+
+class FakeField(datatypes.Field):
+    """A field whose styles come from its context, like GRIBField."""
+
+    def __init__(self, context, path, name, hour, levelist):
+        self.name = self.group_name = name
+        self.title = self.group_title = name
+        self.time = datetime.datetime(2024, 1, 1, hour, tzinfo=datetime.timezone.utc)
+        self.levelist = levelist
+        self.path = path
+        self.pid = os.getpid()
+        self.set_context(context)
+
+    def set_context(self, context):
+        self._context = weakref.ref(context)
+        self.styles = context.stash.setdefault(
+            self.name, context.styler.styles(self.name)
+        )
+
+    @property
+    def context(self):
+        return self._context()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["_context"]
+        return state
+
+
+class FakeReader(datatypes.FieldReader):
+    """Each line of the fake data files is '<name> <hour> <level>'."""
+
+    def get_fields(self):
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        if lines == ["partial"]:
+            raise IOError("%s is being written" % (self.path,))
+        return [
+            FakeField(self.context, self.path, name, int(hour), int(level))
+            for name, hour, level in (line.split() for line in lines)
+        ]
+
+
+class Styler:
+    user_style = None
+
+    def styles(self, name):
+        return ["%s-style" % (name,)]
+
+
+class Context:
+    def __init__(self):
+        self.stash = {}
+        self.styler = Styler()
+
+
+def write(path, *lines):
+    with open(path, "w") as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+def test_scan_files(tmp_path, monkeypatch):
+    # the scan processes are forked, and inherit the fake reader
+    monkeypatch.setitem(fs.EXTENSIONS, ".fake", FakeReader)
+
+    data = tmp_path / "data"
+    data.mkdir()
+    write(data / "a.fake", "t 0 500", "t 0 850")
+    write(data / "b.fake", "t 6 500", "z 6 500")
+    write(data / "c.txt", "not a data file")
+    partial = str(tmp_path / "partial.fake")
+    write(partial, "partial")
+
+    context = Context()
+
+    def load(scan_workers):
+        availability = fs.Availability(
+            str(data), group_dimensions=True, scan_workers=scan_workers
+        )
+        availability.set_context(context)
+        availability.load()
+        return availability
+
+    paths = [str(data / name) for name in ("a.fake", "b.fake", "c.txt")]
+    scanned = load(4).scan_files(paths + [partial])
+
+    # files that cannot be scanned in another process are scanned again by
+    # the server
+    assert sorted(scanned) == sorted(paths)
+    assert "Unsupported file" in scanned[paths[2]]
+
+    fields = scanned[paths[0]] + scanned[paths[1]]
+    assert [(f.name, f.time.hour, f.levelist) for f in fields] == [
+        ("t", 0, 500),
+        ("t", 0, 850),
+        ("t", 6, 500),
+        ("z", 6, 500),
+    ]
+    assert all(f.pid != os.getpid() for f in fields)
+    # the fields are attached to the server, and share its styles
+    assert all(f.context is context for f in fields)
+    assert fields[0].styles is fields[2].styles is context.stash["t"]
+    assert fields[3].styles == ["z-style"]
+
+    # the same layers as a serial scan
+    def layers(availability):
+        return {
+            layer.name: (layer.available_times(), layer.available_elevations())
+            for layer in availability.layers()
+        }
+
+    parallel, serial = load(4), load(0)
+    assert layers(parallel) == layers(serial)
+    assert parallel._paths[paths[0]] == serial._paths[paths[0]] == 2
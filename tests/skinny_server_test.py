@@ -0,0 +1,403 @@
+import io
+
+import pytest
+
+from skinnywms import datatypes
+from skinnywms.caching import Caching
+from skinnywms.server import NoCaching, TmpFile, WMSServer
+
+
+class Request:
+    def __init__(self, args, headers={}):
+        self.url = "http://localhost/wms"
+        self.args = args
+        self.headers = headers
+
+
+class Response:
+    def __init__(self, content=None, mimetype=None, status=200, headers={}):
+        self.content = content
+        self.mimetype = mimetype
+        self.status = status
+        self.headers = headers
+
+
+class Availability:
+    generation = 1
+    auto_add_plotter_layers = False
+
+    def set_context(self, context):
+        pass
+
+    def layers(self):
+        return []
+
+    def layer(self, name, dims):
+        return Layer(name)
+
+    def resolve(self, name):
+        return name
+
+
+class Layer:
+    static = False
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Layer[%s]" % (self.name,)
+
+
+class StaticLayer(Layer):
+    static = True
+
+
+class Output(TmpFile):
+    def target(self, ext):
+        return None
+
+    def content(self):
+        return b"png"
+
+
+class Plotter:
+    supported_crss = []
+    geographic_bounding_box = None
+
+    def set_context(self, context):
+        pass
+
+    def plot(self, *args, **kwargs):
+        self.plotted += 1
+        return "image/png", None
+
+    def legend(self, *args):
+        self.plotted += 1
+
+
+def test_capabilities():
+
+    availability = Availability()
+    server = WMSServer(availability, Plotter(), Plotter())
+
+    rendered = []
+
+    def render_template(template, **variables):
+        rendered.append(template)
+        return '<capabilities %s href="%s"/>' % (
+            len(rendered),
+            variables["service"]["url"],
+        )
+
+    def process(headers={}, url="http://localhost/wms"):
+        request = Request(dict(request="GetCapabilities"), headers)
+        request.url = url
+        return server.process(request, Response, None, render_template)
+
+    response = process()
+    assert response.content == '<capabilities 1 href="http://localhost/wms"/>'
+    etag = response.headers["ETag"]
+
+    # rendered once
+    assert process().content == '<capabilities 1 href="http://localhost/wms"/>'
+    assert process({"If-None-Match": etag}).status == 304
+    assert len(rendered) == 1
+
+    # whatever the URL of the service requested by clients
+    response = process(url='http://example.com/wms?"')
+    assert response.content == '<capabilities 1 href="http://example.com/wms"/>'
+    response = process(url='http://example.com/"wms"')
+    assert response.content == (
+        '<capabilities 1 href="http://example.com/&quot;wms&quot;"/>'
+    )
+    assert response.headers["ETag"] != etag
+    assert len(rendered) == 1
+
+    # and again when the availability changes
+    availability.generation += 1
+    response = process({"If-None-Match": etag})
+    assert response.status == 200
+    assert response.content == '<capabilities 2 href="http://localhost/wms"/>'
+
+
+def test_getmap_etag():
+
+    plotter = Plotter()
+    plotter.plotted = 0
+    server = WMSServer(Availability(), plotter, Plotter(), layer_max_age={"2t": 60})
+
+    def process(headers={}, **args):
+        request = Request(
+            dict(
+                dict(
+                    request="GetMap",
+                    layers="2t",
+                    crs="EPSG:4326",
+                    bbox="-90,-180,90,180",
+                    width="256",
+                    height="256",
+                    format="image/png",
+                ),
+                **args
+            ),
+            headers,
+        )
+        return server.process(request, Response, None, None, output=Output())
+
+    response = process()
+    assert response.content == b"png"
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+    etag = response.headers["ETag"]
+
+    assert process({"If-None-Match": etag}).status == 304
+    assert plotter.plotted == 1
+
+    response = process({"If-None-Match": etag}, width="512")
+    assert response.status == 200
+    assert response.headers["ETag"] != etag
+    assert plotter.plotted == 2
+
+
+def test_legend_cache():
+
+    plotter = Plotter()
+    plotter.plotted = 0
+    server = WMSServer(
+        Availability(), plotter, Plotter(), legend_caching=Caching(memory_size=1000)
+    )
+
+    def process(**args):
+        request = Request(dict(dict(request="GetLegendGraphic", layer="2t"), **args))
+        return server.process(request, Response, None, None, output=Output())
+
+    assert process().content == b"png"
+    assert process().content == b"png"
+    assert plotter.plotted == 1
+
+    process(width="300")
+    assert plotter.plotted == 2
+
+
+def test_static_tiles():
+
+    plotter = Plotter()
+    plotter.plotted = 0
+    server = WMSServer(
+        Availability(), plotter, Plotter(), static_caching=Caching(memory_size=1000)
+    )
+    server.availability.layer = lambda name, dims: StaticLayer(name)
+
+    def process(version, bbox):
+        request = Request(
+            dict(
+                request="GetMap",
+                version=version,
+                layers="foreground",
+                crs="EPSG:4326",
+                srs="EPSG:4326",
+                bbox=bbox,
+                width="256",
+                height="256",
+                format="image/png",
+            )
+        )
+        return server.process(request, Response, None, None, output=Output())
+
+    # the same tile, with the axis order of each version
+    assert process("1.3.0", "-90,0,90,180").content == b"png"
+    assert process("1.1.1", "0.0000001,-90,180,90").content == b"png"
+    assert plotter.plotted == 1
+
+    # in the cache of the maps, if static layers are not cached separately
+    plotter.plotted = 0
+    server.caching = Caching(memory_size=1000)
+    server.static_caching = NoCaching()
+    assert process("1.3.0", "-90,0,90,180").content == b"png"
+    assert process("1.3.0", "-90,0,90,180").content == b"png"
+    assert plotter.plotted == 1
+
+
+def test_composite_layers():
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+
+    colours = {"2t": (255, 0, 0, 255), "background": (0, 0, 255, 255)}
+
+    class PngOutput(Output):
+        def content(self):
+            return self.png
+
+    class PngPlotter(Plotter):
+        def plot(
+            self, context, output, bbox, crs, format, height, layers, *args, **kwargs
+        ):
+            self.plotted.append([layer.name for layer in layers])
+            buffer = io.BytesIO()
+            # the 2t field only covers the left half of the map
+            image = Image.new("RGBA", (2, 1), colours[layers[-1].name])
+            if layers[-1].name == "2t":
+                image.putpixel((1, 0), (0, 0, 0, 0))
+            image.save(buffer, "PNG")
+            output.png = buffer.getvalue()
+            return format, None
+
+    def layer(name, dims):
+        # a data field has no zindex, a static layer has one
+        if name == "2t":
+            return Layer(name)
+        background = StaticLayer(name)
+        background.zindex = -99999
+        return background
+
+    plotter = PngPlotter()
+    plotter.plotted = []
+    server = WMSServer(Availability(), plotter, Plotter(), composite_layers=True)
+    server.availability.layer = layer
+
+    def get_map(format):
+        return server.get_map(
+            PngOutput(),
+            (-90, -180, 90, 180),
+            "EPSG:4326",
+            format,
+            1,
+            ["2t", "background"],
+            "1.3.0",
+            2,
+        )
+
+    _, content = get_map("image/png")
+    with Image.open(io.BytesIO(content)) as image:
+        assert image.convert("RGBA").getpixel((0, 0)) == colours["2t"]
+        assert image.convert("RGBA").getpixel((1, 0)) == colours["background"]
+    # in zindex order
+    assert plotter.plotted == [["background"], ["2t"]]
+
+    # formats that cannot be composited are rendered in one go
+    plotter.plotted = []
+    get_map("image/jpeg")
+    assert plotter.plotted == [["2t", "background"]]
+
+
+def test_metatile():
+    Image = pytest.importorskip("PIL.Image")
+    pytest.importorskip("numpy")
+
+    from skinnywms.tiles import TILE_GRIDS
+
+    class PngOutput(Output):
+        def content(self):
+            return self.png
+
+    class PngPlotter(Plotter):
+        def plot(
+            self, context, output, bbox, crs, format, height, layers, s, v, width, **k
+        ):
+            self.plotted.append((bbox, width, height))
+            # each pixel has its own colour
+            image = Image.new("RGBA", (width, height))
+            for i in range(width):
+                for j in range(height):
+                    image.putpixel((i, j), (i * 10, j * 10, 0, 255))
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG")
+            output.png = buffer.getvalue()
+            return format, None
+
+    plotter = PngPlotter()
+    plotter.plotted = []
+    server = WMSServer(
+        Availability(),
+        plotter,
+        Plotter(),
+        caching=Caching(memory_size=100000),
+        metatile=2,
+        metatile_buffer=3,
+    )
+
+    grid = TILE_GRIDS["EPSG:3857"]
+
+    def get_map(x, y):
+        _, content = server.get_map(
+            PngOutput(),
+            grid.bbox(2, x, y),
+            "EPSG:3857",
+            "image/png",
+            4,
+            ["2t"],
+            "1.3.0",
+            4,
+        )
+        with Image.open(io.BytesIO(content)) as image:
+            return image.size, image.convert("RGBA").getpixel((0, 0))
+
+    # the block of tiles (2, 0) to (3, 1) is rendered once, with a margin of 3
+    # pixels within the grid, i.e. on its left and bottom sides only
+    assert get_map(3, 1) == ((4, 4), (70, 40, 0, 255))
+    ((bbox, width, height),) = plotter.plotted
+    assert (width, height) == (11, 11)
+    dx, dy = grid.span(2)
+    min_x, min_y, _, _ = grid.bbox(2, 2, 1)
+    _, _, max_x, max_y = grid.bbox(2, 3, 0)
+    assert bbox == pytest.approx((min_x - 3 * dx / 4, min_y - 3 * dy / 4, max_x, max_y))
+
+    # and the neighbouring tiles are cached
+    assert get_map(2, 0) == ((4, 4), (30, 0, 0, 255))
+    assert get_map(3, 0) == ((4, 4), (70, 0, 0, 255))
+    assert get_map(2, 1) == ((4, 4), (30, 40, 0, 255))
+    assert len(plotter.plotted) == 1
+
+
+class Field(datatypes.Field):
+    def __init__(self, levelist):
+        self.name = "t@pl_%s" % (levelist,)
+        self.group_name = "t@pl"
+        self.title = self.group_title = "Temperature"
+        self.time = None
+        self.levelist = levelist
+
+
+def test_layer_max_age_grouped():
+
+    availability = datatypes.Availability(group_dimensions=True)
+    for levelist in (500, 850):
+        availability.add_field(Field(levelist))
+
+    plotter = Plotter()
+    plotter.plotted = 0
+    server = WMSServer(availability, plotter, Plotter(), layer_max_age={"t@pl": 60})
+
+    def process(layers):
+        request = Request(
+            dict(
+                request="GetMap",
+                layers=layers,
+                crs="EPSG:4326",
+                bbox="-90,-180,90,180",
+                width="256",
+                height="256",
+                format="image/png",
+                elevation="850",
+            )
+        )
+        return server.process(request, Response, None, None, output=Output())
+
+    # the max-age of the WMS layer, not of the field selected
+    assert process("t@pl").headers["Cache-Control"] == "public, max-age=60"
+    assert process("default").headers["Cache-Control"] == "public, max-age=60"
+
+
+def test_stats():
+
+    class GridCache:
+        def stats(self):
+            return dict(hits=1)
+
+    server = WMSServer(Availability(), Plotter(), Plotter())
+    assert server.stats()["grid_cache"] is None
+
+    server = WMSServer(Availability(), Plotter(), Plotter(), grid_cache=GridCache())
+    stats = server.stats()
+    assert stats["grid_cache"] == dict(hits=1)
+    assert stats["render_pool"] is None
@@ -0,0 +1,29 @@
+from skinnywms.tiles import TILE_GRIDS, locate
+
+
+def test_locate():
+
+    grid = TILE_GRIDS["EPSG:3857"]
+    for zoom, x, y in ((0, 0, 0), (3, 5, 2), (12, 2047, 1365)):
+        bbox = grid.bbox(zoom, x, y)
+        assert locate("EPSG:3857", bbox) == (grid, zoom, x, y)
+        # coordinates rounded by the client
+        assert grid.locate([round(v, 3) for v in bbox]) == (zoom, x, y)
+
+    # two columns of tiles at zoom level 0
+    assert TILE_GRIDS["EPSG:4326"].locate((0, -90, 180, 90)) == (0, 1, 0)
+
+    # not aligned on the grid
+    assert locate("EPSG:3857", (0, 0, 1000, 1000)) is None
+    assert locate("EPSG:4326", (0, 0, 45, 90)) is None
+    assert locate("EPSG:32661", (0, 0, 1, 1)) is None
+
+
+def test_locate_block():
+
+    grid = TILE_GRIDS["EPSG:3857"]
+    min_x, min_y, _, _ = grid.bbox(3, 4, 5)
+    _, _, max_x, max_y = grid.bbox(3, 5, 4)
+    assert grid.locate((min_x, min_y, max_x, max_y), 2, 2) == (3, 4, 4)
+    # which is also a single tile at zoom level 2
+    assert grid.locate((min_x, min_y, max_x, max_y)) == (2, 2, 2)
@@ -0,0 +1,131 @@
+import datetime
+
+from skinnywms.warm import Warmer, parse_time
+
+TIMES = [
+    datetime.datetime(2024, 1, 1, h, tzinfo=datetime.timezone.utc)
+    for h in range(0, 24, 6)
+]
+
+
+class Style:
+    def __init__(self, name):
+        self.name = name
+
+
+class Layer:
+    def __init__(self, name, times, styles=()):
+        self.name = name
+        self.times = times
+        self.styles = [Style(s) for s in styles]
+
+    def available_times(self):
+        return self.times
+
+
+class Availability:
+    def layers(self):
+        return [
+            Layer("2t", TIMES, ["sh_red", "sh_blue"]),
+            Layer("2d", TIMES),
+            Layer("lsm", []),
+        ]
+
+
+class Server:
+    availability = Availability()
+
+
+def test_jobs():
+    warmer = Warmer(
+        Server(),
+        layers=["2*"],
+        styles=["*"],
+        start=parse_time("2024-01-01T06:00:00Z"),
+        end=parse_time("2024-01-01T12:00"),
+        crs="EPSG:4326",
+        zooms=range(0, 2),
+        bboxes=[(0.0, 0.0, 10.0, 10.0)],
+    )
+    jobs = warmer.jobs()
+    # (2 styles of 2t + default style of 2d) x 2 times x 2 tiles
+    assert len(jobs) == 12
+    assert jobs[0] == (
+        "2t",
+        "sh_red",
+        "2024-01-01T06:00:00Z",
+        (0.0, -90.0, 180.0, 90.0),
+    )
+    assert jobs[1] == ("2t", "sh_red", "2024-01-01T06:00:00Z", (0.0, 0.0, 90.0, 90.0))
+
+    # whole grid, layers without time
+    warmer = Warmer(Server(), layers=["lsm"], zooms=range(0, 3))
+    assert len(warmer.jobs()) == 1 + 4 + 16
+    assert {job[2] for job in warmer.jobs()} == {None}
+
+    # single maps
+    warmer = Warmer(Server(), layers=["lsm"], bboxes=[(0, 0, 1, 1), (1, 1, 2, 2)])
+    assert [job[3] for job in warmer.jobs()] == [(0, 0, 1, 1), (1, 1, 2, 2)]
+
+
+def test_render_version():
+    from skinnywms.caching import Caching
+    from skinnywms.server import WMSServer
+
+    class DataLayer(Layer):
+        def __repr__(self):
+            return "Layer[%s]" % (self.name,)
+
+    class ServerAvailability(Availability):
+        generation = 1
+
+        def set_context(self, context):
+            pass
+
+        def layer(self, name, dims):
+            return DataLayer(name, [])
+
+        def resolve(self, name):
+            return name
+
+    class Plotter:
+        def set_context(self, context):
+            pass
+
+        def plot(self, context, output, bbox, *args, **kwargs):
+            self.plotted.append(bbox)
+            return "image/png", None
+
+    class Output:
+        def content(self):
+            return b"png"
+
+        def cleanup(self):
+            pass
+
+    plotter = Plotter()
+    plotter.plotted = []
+    server = WMSServer(
+        ServerAvailability(), plotter, Plotter(), caching=Caching(memory_size=1000)
+    )
+    server.caching.create_output = Output
+
+    # a map of western Europe, rendered as requested with WMS 1.3.0
+    bbox = (-10.0, 35.0, 20.0, 60.0)
+    warmer = Warmer(server, crs="EPSG:4326", bboxes=[bbox], version="1.3.0")
+    warmer.render("2t", "", None, bbox)
+    assert plotter.plotted == [[-10.0, 35.0, 20.0, 60.0]]
+
+    # where a client finds it, in latitude/longitude order
+    server.get_map(
+        Output(),
+        (35.0, -10.0, 60.0, 20.0),
+        "EPSG:4326",
+        "image/png",
+        256,
+        ["2t"],
+        "1.3.0",
+        256,
+        styles=[""],
+    )
+    assert len(plotter.plotted) == 1
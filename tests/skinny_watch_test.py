@@ -0,0 +1,147 @@
+import datetime
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("dateutil")
+
+from skinnywms.data.watch import Watcher, _EventHandler
+from skinnywms.datatypes import Field
+
+
+class TestField(Field):
+    __test__ = False
+
+    def __init__(self, name, time, levelist):
+        self.name = self.group_name = name
+        self.title = self.group_title = name
+        self.time = time
+        self.levelist = levelist
+
+
+def date(hour):
+    return datetime.datetime(2022, 1, 1, hour, tzinfo=datetime.timezone.utc)
+
+
+def fake_scan_file(self, path):
+    """Each line of the fake data files is '<name> <hour> <level>'."""
+    with open(path) as f:
+        lines = f.read().splitlines()
+    if lines and lines[0] == "partial":
+        raise IOError("%s is being written" % (path,))
+    fields = []
+    for line in lines:
+        name, hour, level = line.split()
+        fields.append(TestField(name, date(int(hour)), int(level)))
+    return fields
+
+
+def write(path, *lines):
+    with open(path, "w") as f:
+        f.write("".join(line + "\n" for line in lines))
+
+
+def test_refresh(tmp_path, monkeypatch):
+    try:
+        from skinnywms.data.fs import Availability
+    except Exception:
+        pytest.skip("GRIB bindings not available")
+
+    monkeypatch.setattr(Availability, "scan_file", fake_scan_file)
+
+    write(tmp_path / "a.data", "t 0 500", "t 0 850")
+    availability = Availability(str(tmp_path), group_dimensions=True)
+    availability.load()
+
+    def dimensions(name):
+        availability.layer(name, None)
+        layer = availability._layers[name]
+        return layer.available_times(), layer.available_elevations()
+
+    assert dimensions("t") == ([date(0)], ["500", "850"])
+    assert availability.refresh() is False
+
+    # added
+    write(tmp_path / "b.data", "t 6 500", "z 6 500")
+    generation = availability.generation
+    assert availability.refresh() is True
+    assert availability.generation > generation
+    assert [layer.name for layer in availability.layers()] == ["t", "z"]
+    assert dimensions("t") == ([date(0), date(6)], ["500", "850"])
+    assert dimensions("z") == ([date(6)], ["500"])
+
+    # replaced
+    write(tmp_path / "a.data", "t 12 1000")
+    assert availability.refresh() is True
+    assert dimensions("t") == ([date(6), date(12)], ["1000", "500"])
+
+    # deleted: layers left without fields are removed
+    os.unlink(tmp_path / "b.data")
+    assert availability.refresh() is True
+    assert [layer.name for layer in availability.layers()] == ["t"]
+    assert dimensions("t") == ([date(12)], ["1000"])
+
+    # files that cannot be scanned yet are retried on the next refresh, even
+    # if they have not changed since
+    path = str(tmp_path / "c.data")
+    write(path, "partial")
+    stat = os.stat(path)
+    assert availability.refresh() is True
+    assert [layer.name for layer in availability.layers()] == ["t"]
+    assert isinstance(availability._paths[path], list)
+
+    write(path, "z 18 50")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert availability.refresh() is True
+    assert dimensions("z") == ([date(18)], ["50"])
+    assert availability.refresh() is False
+
+
+def test_events():
+    notified = []
+    handler = _EventHandler(SimpleNamespace(notify=lambda: notified.append(1)))
+
+    # files opened and closed when rendering are not changes
+    for event_type in ("opened", "closed_no_write"):
+        handler.on_any_event(SimpleNamespace(event_type=event_type))
+    assert notified == []
+
+    for event_type in ("created", "modified", "moved", "deleted", "closed"):
+        handler.on_any_event(SimpleNamespace(event_type=event_type))
+    assert len(notified) == 5
+
+
+class Availability:
+    def __init__(self):
+        self.refreshed = threading.Event()
+
+    def refresh(self):
+        self.refreshed.set()
+        return True
+
+
+def test_watcher_max_delay(tmp_path, monkeypatch):
+    monkeypatch.setattr("skinnywms.data.watch.Observer", None)
+
+    availability = Availability()
+    watcher = Watcher(
+        availability, str(tmp_path), interval=3600, delay=0.2, max_delay=0.5
+    )
+    watcher.start()
+    try:
+        # changes that keep coming do not postpone the refresh forever
+        start = time.monotonic()
+        while not availability.refreshed.is_set() and time.monotonic() < start + 5:
+            watcher.notify()
+            time.sleep(0.05)
+        assert availability.refreshed.is_set()
+
+        # and it happens as soon as changes stop for a while
+        availability.refreshed.clear()
+        watcher.notify()
+        assert availability.refreshed.wait(2)
+    finally:
+        watcher.stop()